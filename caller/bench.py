@@ -0,0 +1,155 @@
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Optional
+
+import httpx
+from rich.console import Console
+from rich.table import Table
+
+from caller.client import aclose_async_client, get_async_client
+from caller.resilience import CircuitOpenError
+from caller.sender import PreparedCall, async_send
+from caller.writer import ResponseWriter
+
+HISTOGRAM_BUCKETS = 10
+HISTOGRAM_WIDTH = 40
+
+
+@dataclass
+class BenchResult:
+    latencies: list[float] = field(default_factory=list)
+    status_codes: Counter[int] = field(default_factory=Counter)
+    errors: Counter[str] = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, percent: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = round(percent / 100 * (len(ordered) - 1))
+        return ordered[index]
+
+    def histogram(self) -> list[tuple[float, float, int]]:
+        if not self.latencies:
+            return []
+        low, high = min(self.latencies), max(self.latencies)
+        width = (high - low) / HISTOGRAM_BUCKETS or 1.0
+        counts = [0] * HISTOGRAM_BUCKETS
+        for latency in self.latencies:
+            counts[min(int((latency - low) / width), HISTOGRAM_BUCKETS - 1)] += 1
+        return [
+            (low + i * width, low + (i + 1) * width, count)
+            for i, count in enumerate(counts)
+        ]
+
+
+async def run_bench(
+    prepared: PreparedCall,
+    *,
+    concurrency: int,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    writer: Optional[ResponseWriter] = None,
+) -> BenchResult:
+    """
+    Send `prepared` from `concurrency` workers until `requests` sends
+    have been made or `duration` seconds have passed. Responses are only
+    read (and saved) when a `writer` is given
+    """
+    client = get_async_client()
+    result = BenchResult()
+    remaining = requests
+    start = perf_counter()
+    deadline = start + duration if duration is not None else None
+
+    async def worker() -> None:
+        nonlocal remaining
+        while True:
+            if deadline is not None and perf_counter() >= deadline:
+                return
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+
+            try:
+                sent = await async_send(
+                    client, prepared, capture=writer is not None, retry=False
+                )
+            except CircuitOpenError as e:
+                # the host is down, stop instead of hammering it
+                result.errors[type(e).__name__] += 1
+                return
+            except httpx.HTTPError as e:
+                result.errors[type(e).__name__] += 1
+                continue
+
+            # the timer starts after the rate limiter, waiting for it is not
+            # part of how long the endpoint took
+            result.latencies.append((sent.timings.total_ms or 0.0) / 1000)
+            result.status_codes[sent.status_code] += 1
+            if writer is not None:
+                await writer.submit_async(prepared, sent)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        result.elapsed = perf_counter() - start
+        await aclose_async_client()
+
+    return result
+
+
+def print_bench_result(console: Console, result: BenchResult) -> None:
+    summary = Table(title="summary")
+    summary.add_column("requests", justify="right")
+    summary.add_column("errors", justify="right")
+    summary.add_column("duration (s)", justify="right")
+    summary.add_column("req/s", justify="right")
+    for percent in ("p50", "p90", "p99"):
+        summary.add_column(f"{percent} (ms)", justify="right")
+    summary.add_column("max (ms)", justify="right")
+    summary.add_row(
+        str(result.total),
+        str(sum(result.errors.values())),
+        f"{result.elapsed:.2f}",
+        f"{result.throughput:.1f}",
+        f"{result.percentile(50) * 1000:.1f}",
+        f"{result.percentile(90) * 1000:.1f}",
+        f"{result.percentile(99) * 1000:.1f}",
+        f"{max(result.latencies, default=0.0) * 1000:.1f}",
+    )
+    console.print(summary)
+
+    codes = Table(title="status codes")
+    codes.add_column("code")
+    codes.add_column("count", justify="right")
+    for code, count in sorted(result.status_codes.items()):
+        codes.add_row(str(code), str(count))
+    for error, count in result.errors.most_common():
+        codes.add_row(f"[red]{error}", str(count))
+    console.print(codes)
+
+    buckets = result.histogram()
+    if not buckets:
+        return
+
+    histogram = Table(title="latency histogram")
+    histogram.add_column("ms")
+    histogram.add_column("count", justify="right")
+    histogram.add_column("")
+    most = max(count for _, _, count in buckets)
+    for low, high, count in buckets:
+        bar = "█" * round(count / most * HISTOGRAM_WIDTH)
+        histogram.add_row(f"{low * 1000:.1f} - {high * 1000:.1f}", str(count), bar)
+    console.print(histogram)
@@ -0,0 +1,147 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+from caller.config import settings
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+class BlobStore:
+    """
+    Content addressed on-disk store for response bodies that are too
+    large to keep inline in the database
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def open(self, key: str) -> Buffer:
+        with open(self.path(key), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def head(self, key: str, size: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read(size)
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def age(self, key: str) -> float:
+        """
+        Seconds since the file was last written, 0 when it does not exist
+        """
+        try:
+            return time.time() - self.path(key).stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def keys(self, *, older_than: float = 0) -> Iterator[str]:
+        """
+        Keys of the stored files last written at least `older_than` seconds
+        ago. Temporary files of captures in progress are not included
+        """
+        if not self.root.is_dir():
+            return
+        cutoff = time.time() - older_than
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                try:
+                    if path.stat().st_mtime <= cutoff:
+                        yield path.name
+                except FileNotFoundError:
+                    continue
+
+    def _temp_file(self) -> IO[bytes]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.root, delete=False)
+
+    def _commit(self, temp_path: str, key: str) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, path)
+
+
+blob_store = BlobStore(settings.blob_dir)
+
+
+@dataclass
+class CapturedBody:
+    content: Optional[bytes] = None
+    blob_key: Optional[str] = None
+    hash: Optional[str] = None
+    size: int = 0
+    truncated: bool = False
+
+
+class BodyCapture:
+    """
+    Collect a response body chunk by chunk. Bodies stay in memory up to
+    `inline_threshold` bytes and are spilled to the blob store after that.
+    Anything past `max_capture` bytes is dropped
+    """
+
+    def __init__(self, store: BlobStore = blob_store) -> None:
+        self.store = store
+        self.inline_threshold = settings.inline_threshold
+        self.max_capture = settings.max_capture
+        self.size = 0
+        self.truncated = False
+        self._buffer = bytearray()
+        self._file: Optional[IO[bytes]] = None
+        self._hash = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> bool:
+        """
+        Returns False once the capture cap has been reached
+        """
+        if self.max_capture is not None and self.size + len(chunk) > self.max_capture:
+            chunk = chunk[: self.max_capture - self.size]
+            self.truncated = True
+
+        self.size += len(chunk)
+        self._hash.update(chunk)
+
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer += chunk
+            if len(self._buffer) > self.inline_threshold:
+                self._file = self.store._temp_file()
+                self._file.write(self._buffer)
+                self._buffer = bytearray()
+
+        return not self.truncated
+
+    def finish(self) -> CapturedBody:
+        key = self._hash.hexdigest()
+        if self._file is None:
+            return CapturedBody(
+                content=bytes(self._buffer),
+                hash=key,
+                size=self.size,
+                truncated=self.truncated,
+            )
+
+        self._file.close()
+        self.store._commit(self._file.name, key)
+        return CapturedBody(
+            blob_key=key, hash=key, size=self.size, truncated=self.truncated
+        )
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            os.unlink(self._file.name)
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import auto
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from caller.blobs import CapturedBody
+from caller.crud.responses import response_crud
+from caller.db import APICall
+from caller.enums import Method, StrEnumLower
+
+CACHEABLE_METHODS = {Method.GET}
+CACHEABLE_CODES = {200, 203}
+
+
+class CacheStatus(StrEnumLower):
+    MISS = auto()
+    FRESH = auto()
+    REVALIDATED = auto()
+
+
+@dataclass
+class CachedResponse:
+    response_id: int
+    code: int
+    headers: dict[str, str]
+    body: CapturedBody
+    fresh: bool
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if (etag := self.headers.get("etag")) is not None:
+            headers["If-None-Match"] = etag
+        if (last_modified := self.headers.get("last-modified")) is not None:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+
+def _cache_control(headers: dict[str, str]) -> dict[str, Optional[str]]:
+    directives: dict[str, Optional[str]] = {}
+    for directive in headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: dict[str, str], date: datetime) -> float:
+    """
+    Seconds a stored response may be reused without revalidation,
+    from `Cache-Control: max-age` or `Expires`
+    """
+    directives = _cache_control(headers)
+    if "no-cache" in directives or "no-store" in directives:
+        return 0.0
+
+    if (max_age := directives.get("max-age")) is not None:
+        try:
+            return max(float(max_age) - float(headers.get("age", 0)), 0.0)
+        except ValueError:
+            return 0.0
+
+    if (expires := headers.get("expires")) is not None:
+        try:
+            return max((parsedate_to_datetime(expires) - date).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    return 0.0
+
+
+def lookup(session: Session, api_call: APICall) -> Optional[CachedResponse]:
+    """
+    The latest stored 200/203 response of `api_call` if it can be used to
+    answer or revalidate the next send. Error responses stored since then
+    do not hide it
+    """
+    if not api_call.use_cache or api_call.method not in CACHEABLE_METHODS:
+        return None
+
+    latest = response_crud.get_latest(
+        session, api_call_id=api_call.id, codes=CACHEABLE_CODES
+    )
+    if latest is None:
+        return None
+
+    headers = {
+        k.lower(): v for k, v in (latest.data or {}).get("res_headers", {}).items()
+    }
+    if "no-store" in _cache_control(headers) or latest.stored_body is None:
+        return None
+
+    timestamp = latest.timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - timestamp).total_seconds()
+
+    stored_body = latest.stored_body
+    body = CapturedBody(hash=stored_body.hash, size=stored_body.size)
+    if stored_body.blob:
+        body.blob_key = stored_body.hash
+    else:
+        body.content = bytes(stored_body.read())
+
+    return CachedResponse(
+        response_id=latest.id,
+        code=latest.code,
+        headers=headers,
+        body=body,
+        fresh=age < freshness_lifetime(headers, timestamp),
+    )
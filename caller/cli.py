@@ -1,19 +1,458 @@
+import asyncio
+import sys
+from collections import Counter
+from contextlib import AbstractContextManager, nullcontext
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional, TextIO
+
 import typer
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from rich.console import Console
+from rich.prompt import Confirm
+from rich.table import Table
+from rich.text import Text
+from sqlalchemy.exc import IntegrityError, OperationalError
 
-from caller.db import Base
+from caller import retention
+from caller.bench import print_bench_result, run_bench
+from caller.client import check_http2
+from caller.codecs import Codec, check_codec
+from caller.config import RateLimit, settings
+from caller.crud import api_call_crud, body_crud, response_crud, rollup_crud
+from caller.engine import get_engine, get_session
+from caller.enums import Period
+from caller.importers import har_calls, import_calls, load_document, openapi_calls
 from caller.main import init
 from caller.main_tui import run_tui_app
+from caller.runner import print_run_results, run_collection
+from caller.search import HIGHLIGHT
+from caller.search import reindex as rebuild_search_index
+from caller.search import search_api_calls, search_responses
+from caller.sender import prepare
+from caller.stats import print_rollups
+from caller.transfer import export_jsonl, import_jsonl
+from caller.writer import ResponseWriter
+
+app = typer.Typer()
+err_console = Console(stderr=True, style="bold red")
+
+
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    debug: bool = False,
+    http2: bool = False,
+    db: Optional[Path] = typer.Option(
+        None, help="sqlite database file (default: $CALLER_DB or api_call.db)"
+    ),
+    rate: Optional[float] = typer.Option(
+        None, min=0, help="max requests per second per host"
+    ),
+    burst: int = typer.Option(1, min=1, help="requests allowed in a burst"),
+) -> None:
+    if http2:
+        settings.http2 = True
+    _check_dependencies()
+
+    if db is not None:
+        settings.db = db
+
+    if rate:
+        settings.rate_limit = RateLimit(rate=rate, burst=burst)
+
+    if ctx.invoked_subcommand is None:
+        init(debug=debug)
+
+
+@app.command()
+def bench(
+    api_call_id: int,
+    concurrency: int = typer.Option(10, "--concurrency", "-c", min=1),
+    requests: Optional[int] = typer.Option(None, "--requests", "-n", min=1),
+    duration: Optional[float] = typer.Option(None, "--duration", "-d", min=0),
+    save: bool = typer.Option(False, help="save every response, written behind"),
+) -> None:
+    """
+    Fire a saved api call at high concurrency and report
+    throughput, latency percentiles and status codes
+    """
+    if (requests is None) == (duration is None):
+        err_console.print("provide exactly one of --requests or --duration")
+        raise typer.Exit(code=1)
+
+    with get_session() as session:
+        if (api_call := api_call_crud.get(session, id=api_call_id)) is None:
+            err_console.print("api call not found")
+            raise typer.Exit(code=1)
+
+        try:
+            prepared = prepare(session, api_call, use_cache=False)
+        except ValidationError as e:
+            err_console.print("api call not ready to send")
+            for err in e.errors():
+                err_console.print(f'{err["loc"]}: {err["msg"]}')
+            raise typer.Exit(code=1)
+
+    # let every worker hold its own connection
+    settings.max_connections = max(settings.max_connections, concurrency)
+    settings.max_keepalive_connections = max(
+        settings.max_keepalive_connections, concurrency
+    )
+
+    saving: AbstractContextManager[Optional[ResponseWriter]] = nullcontext()
+    if save:
+        saving = ResponseWriter(get_engine())
+    with saving as writer:
+        result = asyncio.run(
+            run_bench(
+                prepared,
+                concurrency=concurrency,
+                requests=requests,
+                duration=duration,
+                writer=writer,
+            )
+        )
+    print_bench_result(Console(), result)
+
+
+@app.command()
+def run(
+    name: Optional[str] = typer.Option(None, help="only calls whose name contains"),
+    tag: Optional[str] = typer.Option(None, help="only calls with this tag"),
+    concurrency: int = typer.Option(10, "--concurrency", "-c", min=1),
+    write_behind: bool = typer.Option(
+        True, help="save responses from a background writer as they arrive"
+    ),
+) -> None:
+    """
+    Send all (or a filtered set of) saved api calls concurrently
+    and save their responses
+    """
+    with get_session() as session:
+        api_calls = api_call_crud.get_filtered(session, name=name, tag=tag)
+        if not api_calls:
+            err_console.print("no api calls matched")
+            raise typer.Exit(code=1)
+
+        settings.max_connections = max(settings.max_connections, concurrency)
+        saving: AbstractContextManager[Optional[ResponseWriter]] = nullcontext()
+        if write_behind:
+            saving = ResponseWriter(get_engine())
+        with saving as writer:
+            results = asyncio.run(
+                run_collection(
+                    session, api_calls, concurrency=concurrency, writer=writer
+                )
+            )
+        print_run_results(Console(), results)
+
+    if not all(result.ok for result in results):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def compress(
+    codec: Codec = typer.Option(settings.codec, help="codec to store bodies with"),
+    batch_size: int = typer.Option(500, min=1),
+    vacuum: bool = typer.Option(False, help="VACUUM afterwards to reclaim space"),
+) -> None:
+    """
+    Move bodies of older responses into the deduplicated body store
+    and recompress the stored bodies with another codec
+    """
+    _check_dependencies(codec)
+    console = Console()
+    with get_session() as session:
+        moved = response_crud.migrate_bodies(session, batch_size=batch_size)
+        console.print(f"moved {moved} response body(s) into the body store")
+
+        rewritten = body_crud.recompress(session, codec=codec, batch_size=batch_size)
+        console.print(f"recompressed {rewritten} body(s) with {codec.value}")
+
+    if vacuum:
+        with get_engine().connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+@app.command()
+def prune(
+    batch_size: int = typer.Option(500, min=1),
+    vacuum: bool = typer.Option(False, help="VACUUM afterwards to reclaim space"),
+) -> None:
+    """
+    Delete responses that fall outside the retention policy of their
+    api call (or the global CALLER_RETENTION policy) and blob files
+    nothing has referred to for CALLER_BLOB_GRACE_PERIOD seconds
+    """
+    with get_session() as session:
+        pruned = retention.prune(session, batch_size=batch_size)
+        swept = body_crud.sweep_blobs(session)
+    retention.incremental_vacuum(get_engine())
+    Console().print(f"pruned {pruned} response(s), removed {swept} blob file(s)")
+
+    if vacuum:
+        with get_engine().connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+@app.command("search")
+def search_command(
+    query: str,
+    limit: int = typer.Option(20, "--limit", "-n", min=1, help="results per page"),
+    raw: bool = typer.Option(False, help="pass the query through as FTS5 syntax"),
+) -> None:
+    """
+    Full-text search over api calls and the bodies and headers of
+    stored responses, best matches first
+    """
+    console = Console()
+    with get_session() as session:
+        try:
+            api_call_hits = search_api_calls(session, query, limit=limit, raw=raw)
+        except OperationalError as e:
+            err_console.print(f"invalid query: {e.orig}")
+            raise typer.Exit(code=1)
+
+        if api_call_hits:
+            table = Table(title="api calls")
+            table.add_column("id", justify="right")
+            table.add_column("name")
+            table.add_column("url")
+            table.add_column("match")
+            for call_hit in api_call_hits:
+                table.add_row(
+                    str(call_hit.id),
+                    call_hit.name,
+                    call_hit.url or "",
+                    _highlight(call_hit.snippet),
+                )
+            console.print(table)
+
+        after = None
+        while True:
+            hits = search_responses(session, query, after=after, limit=limit, raw=raw)
+            if not hits:
+                break
+
+            table = Table(title="responses")
+            table.add_column("id", justify="right")
+            table.add_column("call", justify="right")
+            table.add_column("timestamp")
+            table.add_column("code", justify="right")
+            table.add_column("match")
+            for hit in hits:
+                table.add_row(
+                    str(hit.id),
+                    str(hit.api_call_id),
+                    str(hit.timestamp),
+                    str(hit.code),
+                    _highlight(hit.snippet),
+                )
+            console.print(table)
+
+            if len(hits) < limit or not sys.stdin.isatty():
+                break
+            if not Confirm.ask("show more?"):
+                break
+            after = hits[-1].cursor
+
+        if not api_call_hits and after is None and not hits:
+            console.print("no matches")
+
+
+@app.command()
+def reindex(batch_size: int = typer.Option(500, min=1)) -> None:
+    """
+    Rebuild the full-text search index, e.g. for responses stored
+    before search existed
+    """
+    with get_session() as session:
+        bodies, responses = rebuild_search_index(session, batch_size=batch_size)
+    Console().print(f"indexed {bodies} distinct bodies and {responses} response(s)")
+
+
+@app.command()
+def stats(
+    api_call_id: int,
+    hours: int = typer.Option(24, min=0, help="hours to show hourly rollups for"),
+    days: int = typer.Option(7, min=0, help="days to show daily rollups for"),
+) -> None:
+    """
+    Requests, errors and latency percentiles of an api call per hour
+    and day, read from rollups that are updated as responses are saved
+    """
+    now = datetime.now(timezone.utc)
+    console = Console()
+    with get_session() as session:
+        if api_call_crud.get(session, id=api_call_id) is None:
+            err_console.print("api call not found")
+            raise typer.Exit(code=1)
+
+        for title, period, count, step in (
+            ("hourly", Period.HOUR, hours, timedelta(hours=1)),
+            ("daily", Period.DAY, days, timedelta(days=1)),
+        ):
+            if count == 0:
+                continue
+            rollups = rollup_crud.get_since(
+                session,
+                api_call_id=api_call_id,
+                period=period,
+                since=now - step * (count - 1),
+            )
+            print_rollups(console, title, rollups)
+
+
+@app.command()
+def restat(batch_size: int = typer.Option(500, min=1)) -> None:
+    """
+    Recompute the rollups shown by `stats` from the stored responses,
+    e.g. for responses saved before rollups existed
+    """
+    with get_session() as session:
+        counted = rollup_crud.rebuild(session, batch_size=batch_size)
+    Console().print(f"counted {counted} response(s)")
+
+
+@app.command("export")
+def export_command(
+    path: Optional[Path] = typer.Argument(None, help="file to write, default stdout"),
+    responses: bool = typer.Option(False, help="include stored responses"),
+    batch_size: int = typer.Option(500, min=1),
+) -> None:
+    """
+    Export api calls, their headers and parameters, global headers and
+    optionally the response history as JSON Lines
+    """
+    out_file: AbstractContextManager[TextIO] = nullcontext(sys.stdout)
+    if path is not None:
+        out_file = open(path, "w")
+    with get_session() as session:
+        with out_file as out:
+            counts = export_jsonl(
+                session, out, responses=responses, batch_size=batch_size
+            )
+    Console(stderr=True).print(_count_summary("exported", counts))
+
+
+@app.command("import")
+def import_command(
+    path: Path,
+    keep_ids: bool = typer.Option(
+        False, help="keep the exported ids instead of assigning new ones"
+    ),
+    batch_size: int = typer.Option(500, min=1),
+) -> None:
+    """
+    Import a file written by `export`. Nothing is imported if any of
+    it fails
+    """
+    with get_session() as session, open(path) as lines:
+        try:
+            counts = import_jsonl(
+                session, lines, keep_ids=keep_ids, batch_size=batch_size
+            )
+        except ValueError as e:
+            err_console.print(f"invalid export: {e}")
+            raise typer.Exit(code=1)
+        except IntegrityError:
+            err_console.print("ids already in use, import without --keep-ids")
+            raise typer.Exit(code=1)
+    Console().print(_count_summary("imported", counts))
+
+
+@app.command()
+def openapi(
+    path: Path,
+    base_url: Optional[str] = typer.Option(
+        None, help="use instead of the first server of the spec"
+    ),
+    batch_size: int = typer.Option(500, min=1),
+) -> None:
+    """
+    Create an api call for every operation of an OpenAPI 3 document
+    (JSON, or YAML with pyyaml installed). Importing it again updates
+    the operations that changed
+    """
+    try:
+        calls = openapi_calls(load_document(path), base_url=base_url)
+        with get_session() as session:
+            counts = import_calls(session, calls, batch_size=batch_size)
+    except RuntimeError as e:
+        err_console.print(e)
+        raise typer.Exit(code=1)
+    except (OSError, ValueError, KeyError) as e:
+        err_console.print(f"invalid spec: {e!r}")
+        raise typer.Exit(code=1)
+    _print_import_counts(counts)
+
+
+@app.command()
+def har(path: Path, batch_size: int = typer.Option(500, min=1)) -> None:
+    """
+    Create an api call for every distinct request of a HAR capture.
+    Importing it again updates the requests that changed
+    """
+    try:
+        calls = har_calls(load_document(path))
+        with get_session() as session:
+            counts = import_calls(session, calls, batch_size=batch_size)
+    except RuntimeError as e:
+        err_console.print(e)
+        raise typer.Exit(code=1)
+    except (OSError, ValueError, KeyError) as e:
+        err_console.print(f"invalid HAR file: {e!r}")
+        raise typer.Exit(code=1)
+    _print_import_counts(counts)
+
+
+def _print_import_counts(counts: Counter[str]) -> None:
+    Console().print(
+        f"created {counts['created']}, updated {counts['updated']}, "
+        f"unchanged {counts['unchanged']} api call(s)"
+    )
+
+
+def _count_summary(verb: str, counts: Counter[str]) -> str:
+    return (
+        f"{verb} {counts['api_call']} api call(s), "
+        f"{counts['header']} global header(s), {counts['response']} response(s)"
+    )
+
+
+def _highlight(snippet: str) -> Text:
+    text = Text(snippet)
+    text.highlight_regex(f"{HIGHLIGHT[0]}[^{HIGHLIGHT[1]}]*{HIGHLIGHT[1]}", "bold")
+    return text
+
+
+def _check_dependencies(*codecs: Codec) -> None:
+    try:
+        check_http2()
+        for codec in (settings.codec, *codecs):
+            check_codec(codec)
+    except RuntimeError as e:
+        err_console.print(e)
+        raise typer.Exit(code=1)
 
 
 def run_app() -> None:
-    typer.run(init)
+    app()
 
 
-def run_tui() -> None:
-    engine = create_engine("sqlite:///api_call.db")
-    Base.metadata.create_all(engine)
+def tui(
+    db: Optional[Path] = typer.Option(
+        None, help="sqlite database file (default: $CALLER_DB or api_call.db)"
+    ),
+) -> None:
+    if db is not None:
+        settings.db = db
+    _check_dependencies()
 
-    with Session(engine) as session:
+    with get_session(expire_on_commit=False) as session:
         run_tui_app(session)
+
+
+def run_tui() -> None:
+    typer.run(tui)
@@ -0,0 +1,60 @@
+from importlib.util import find_spec
+from typing import Optional
+
+import httpx
+
+from caller.config import settings
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+
+
+def check_http2() -> None:
+    """
+    Fail early with a readable error instead of on the first send when
+    HTTP/2 is enabled but the optional 'h2' package is missing
+    """
+    if settings.http2 and find_spec("h2") is None:
+        raise RuntimeError(
+            "HTTP/2 requires the 'h2' package, install caller with the http2 extra"
+        )
+
+
+def get_client() -> httpx.Client:
+    """
+    Shared client used by every synchronous send so connections
+    (and TLS sessions) are kept alive between calls to the same host
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.Client(http2=settings.http2, limits=_limits())
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(http2=settings.http2, limits=_limits())
+    return _async_client
+
+
+def close_client() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+async def aclose_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -0,0 +1,86 @@
+import lzma
+import zlib
+from enum import auto
+from typing import Optional
+
+from caller.enums import StrEnumLower
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+
+class Codec(StrEnumLower):
+    IDENTITY = auto()
+    ZLIB = auto()
+    LZMA = auto()
+    ZSTD = auto()
+
+
+def check_codec(codec: Codec) -> None:
+    """
+    Fail early with a readable error when `codec` needs an optional
+    package that is not installed
+    """
+    if codec == Codec.ZSTD:
+        _require_zstd()
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise RuntimeError(
+            "the zstd codec requires the 'zstandard' package,"
+            " install caller with the zstd extra"
+        )
+
+
+def compress(data: bytes, codec: Codec) -> bytes:
+    if codec == Codec.ZLIB:
+        return zlib.compress(data)
+    if codec == Codec.LZMA:
+        return lzma.compress(data)
+    if codec == Codec.ZSTD:
+        _require_zstd()
+        return zstandard.compress(data)
+    return data
+
+
+def decompress(data: bytes, codec: Optional[Codec]) -> bytes:
+    if codec == Codec.ZLIB:
+        return zlib.decompress(data)
+    if codec == Codec.LZMA:
+        return lzma.decompress(data)
+    if codec == Codec.ZSTD:
+        _require_zstd()
+        return zstandard.decompress(data)
+    return data
+
+
+def decompress_head(data: bytes, codec: Optional[Codec], size: int) -> bytes:
+    """
+    The first `size` bytes of `data` decompressed, without decompressing
+    the rest
+    """
+    if codec == Codec.ZLIB:
+        return zlib.decompressobj().decompress(data, size)
+    if codec == Codec.LZMA:
+        return lzma.LZMADecompressor().decompress(data, max_length=size)
+    if codec == Codec.ZSTD:
+        _require_zstd()
+        return zstandard.ZstdDecompressor().stream_reader(data).read(size)
+    return data[:size]
+
+
+def encode(data: bytes, codec: Codec, min_size: int = 0) -> tuple[bytes, Codec]:
+    """
+    Compress `data` unless it is smaller than `min_size` or
+    compression does not make it smaller
+    """
+    if codec == Codec.IDENTITY or len(data) < min_size:
+        return data, Codec.IDENTITY
+
+    compressed = compress(data, codec)
+    if len(compressed) >= len(data):
+        return data, Codec.IDENTITY
+    return compressed, codec
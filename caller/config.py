@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, BaseSettings, Field
+
+from caller.codecs import Codec
+from caller.schemas.retention import RetentionPolicy
+
+
+class RateLimit(BaseModel):
+    rate: float = Field(gt=0)
+    burst: int = Field(1, ge=1)
+
+
+class Settings(BaseSettings):
+    db: Path = Path("api_call.db")
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = 64 * 1024  # KiB
+    sqlite_busy_timeout: int = 5000  # ms
+    page_size: int = 100
+
+    http2: bool = False
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 5.0
+    timeout: float = 30.0
+
+    blob_dir: Path = Path("blobs")
+    inline_threshold: int = 64 * 1024
+    max_capture: Optional[int] = 256 * 1024 * 1024
+    # unreferenced blob files younger than this (seconds) are kept
+    blob_grace_period: float = 60 * 60
+
+    rate_limit: Optional[RateLimit] = None
+    rate_limits: dict[str, RateLimit] = {}
+
+    breaker_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    codec: Codec = Codec.ZLIB
+    compress_min_size: int = 256
+
+    # only the start of large bodies is made searchable
+    search_body_limit: int = 64 * 1024
+    search_headers: list[str] = [
+        "content-type",
+        "location",
+        "x-request-id",
+        "x-correlation-id",
+    ]
+
+    write_queue_size: int = 1000
+    write_batch_size: int = 500
+    write_flush_interval: float = 0.5
+
+    # used for api calls without a retention policy of their own
+    retention: Optional[RetentionPolicy] = None
+    prune_interval: float = 15 * 60
+
+    class Config:
+        env_prefix = "CALLER_"
+
+
+settings = Settings()
@@ -1,6 +1,17 @@
 from .api_calls import api_call_crud
+from .base import unit_of_work
+from .bodies import body_crud
 from .headers import header_crud
 from .parameters import parameter_crud
 from .responses import response_crud
+from .rollups import rollup_crud
 
-__all__ = ["api_call_crud", "header_crud", "response_crud", "parameter_crud"]
+__all__ = [
+    "api_call_crud",
+    "body_crud",
+    "header_crud",
+    "response_crud",
+    "parameter_crud",
+    "rollup_crud",
+    "unit_of_work",
+]
@@ -1,10 +1,56 @@
-from caller.crud.base import CRUDBase
-from caller.db import APICall
+from typing import Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, load_only, selectinload
+
+from caller.crud.base import BATCH_SIZE, CRUDBase, unit_of_work
+from caller.crud.responses import response_crud
+from caller.crud.rollups import rollup_crud
+from caller.db import APICall, Response
 from caller.schemas.api_calls import APICallCreate, APICallUpdate
 
 
 class CRUDAPICall(CRUDBase[APICall, APICallCreate, APICallUpdate]):
-    ...
+    # everything needed to send a call comes back in one round trip
+    load_options = (selectinload(APICall.headers), selectinload(APICall.parameters))
+
+    def get_filtered(
+        self, session: Session, *, name: Optional[str] = None, tag: Optional[str] = None
+    ) -> list[APICall]:
+        stmt = select(APICall).order_by(APICall.id).options(*self.load_options)
+        if name is not None:
+            stmt = stmt.where(APICall.name.contains(name, autoescape=True))
+        if tag is not None:
+            tags = func.json_each(APICall.tags).table_valued("value")
+            stmt = stmt.where(select(tags.c.value).where(tags.c.value == tag).exists())
+        return list(session.execute(stmt).scalars())
+
+    def remove(self, session: Session, *, obj: APICall) -> APICall:
+        with unit_of_work(session):
+            self._remove_responses(session, api_call_ids=[obj.id])
+            rollup_crud.remove_by_api_call(session, api_call_id=obj.id)
+            return super().remove(session, obj=obj)
+
+    def remove_many(self, session: Session, *, objs: Sequence[APICall]) -> int:
+        # one by one so headers and parameters cascade
+        with unit_of_work(session):
+            for obj in objs:
+                self.remove(session, obj=obj)
+        return len(objs)
+
+    def _remove_responses(self, session: Session, *, api_call_ids: list[int]) -> None:
+        """
+        Responses are never loaded through the relationship so they are
+        removed here in batches, releasing their bodies on the way
+        """
+        stmt = (
+            select(Response)
+            .where(Response.api_call_id.in_(api_call_ids))
+            .options(load_only(Response.id, Response.body_hash))
+            .limit(BATCH_SIZE)
+        )
+        while responses := list(session.execute(stmt).scalars()):
+            response_crud.remove_many(session, objs=responses)
 
 
 api_call_crud = CRUDAPICall(APICall)
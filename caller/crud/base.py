@@ -1,8 +1,22 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import CursorResult, delete, insert, select
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.base import ExecutableOption
 
 from caller.db import Base
 
@@ -10,8 +24,39 @@ ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# keep IN (...) lists well under sqlite's bound parameter limit
+BATCH_SIZE = 500
+
+
+@contextmanager
+def unit_of_work(session: Session) -> Iterator[Session]:
+    """
+    Group CRUD writes into a single transaction. Inside the block
+    create/update/remove only flush and the transaction is committed once
+    on exit, or rolled back if the block raises. Blocks can be nested
+    """
+    depth = session.info.get("unit_of_work", 0)
+    session.info["unit_of_work"] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except BaseException:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info["unit_of_work"] = depth
+
+
+def in_unit_of_work(session: Session) -> bool:
+    return session.info.get("unit_of_work", 0) > 0
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    # loader options applied to every read, e.g. eager loading relationships
+    load_options: Sequence[ExecutableOption] = ()
+
     def __init__(self, model: Type[ModelType]):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
@@ -25,6 +70,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
     def get(self, session: Session, id: Any) -> Optional[ModelType]:
         stmt = select(self.model).where(self.model.id == id)
+        stmt = stmt.options(*self.load_options)
         result = session.execute(stmt)
         return result.scalars().first()
 
@@ -32,6 +78,21 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self, session: Session, *, skip: int = 0, limit: int = 100
     ) -> List[ModelType]:
         stmt = select(self.model).offset(skip).limit(limit)
+        stmt = stmt.options(*self.load_options)
+        result = session.execute(stmt)
+        return list(result.scalars())
+
+    def get_page(
+        self, session: Session, *, after: Optional[int] = None, limit: int = 100
+    ) -> List[ModelType]:
+        """
+        Keyset pagination by id. Returns up to `limit` rows following the
+        row with id `after` so any page costs the same as the first one
+        """
+        stmt = select(self.model).order_by(self.model.id).limit(limit)
+        stmt = stmt.options(*self.load_options)
+        if after is not None:
+            stmt = stmt.where(self.model.id > after)
         result = session.execute(stmt)
         return list(result.scalars())
 
@@ -39,10 +100,38 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         # TODO: jsonable_encoder
         db_obj = self.model(**obj_in.dict())
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        self._commit(session)
+        if not in_unit_of_work(session):
+            session.refresh(db_obj)
         return db_obj
 
+    def create_many(
+        self, session: Session, *, objs_in: Sequence[CreateSchemaType]
+    ) -> List[ModelType]:
+        """
+        Insert all of `objs_in` with multi-row INSERT .. RETURNING
+        in a single transaction. Rows are returned in the order of `objs_in`
+        """
+        if not objs_in:
+            return []
+
+        values = [obj_in.dict() for obj_in in objs_in]
+        stmt = insert(self.model).returning(self.model)
+        db_objs = list(session.scalars(stmt, values))
+
+        # RETURNING rows come back in no particular order, and asking for
+        # parameter order makes SQLAlchemy fall back to one INSERT per row.
+        # Ids given by the caller pair the rows up directly, new ones are
+        # handed out in increasing order as the rows are inserted
+        if all(value.get("id") is not None for value in values):
+            by_id = {db_obj.id: db_obj for db_obj in db_objs}
+            db_objs = [by_id[value["id"]] for value in values]
+        else:
+            db_objs.sort(key=lambda db_obj: db_obj.id)
+
+        self._commit(session)
+        return db_objs
+
     def update(
         self,
         session: Session,
@@ -50,16 +139,63 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        # TODO: firgure out the typing here
-        update_data = obj_in.dict(exclude_unset=True)  # type: ignore
-        for field in update_data.keys():
-            setattr(db_obj, field, update_data[field])
+        self._apply(db_obj, obj_in)
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        self._commit(session)
+        if not in_unit_of_work(session):
+            session.refresh(db_obj)
         return db_obj
 
+    def update_many(
+        self,
+        session: Session,
+        *,
+        db_objs: Sequence[ModelType],
+        objs_in: Sequence[Union[UpdateSchemaType, Dict[str, Any]]]
+    ) -> List[ModelType]:
+        """
+        Apply `objs_in[i]` to `db_objs[i]` and write all of them in a
+        single transaction
+        """
+        for db_obj, obj_in in zip(db_objs, objs_in, strict=True):
+            self._apply(db_obj, obj_in)
+        session.add_all(db_objs)
+        self._commit(session)
+        return list(db_objs)
+
     def remove(self, session: Session, *, obj: ModelType) -> ModelType:
         session.delete(obj)
-        session.commit()
+        self._commit(session)
         return obj
+
+    def remove_many(self, session: Session, *, objs: Sequence[ModelType]) -> int:
+        """
+        Delete all of `objs` in a single transaction. Returns the number
+        of rows deleted
+        """
+        ids = [obj.id for obj in objs]
+        removed = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            stmt = delete(self.model).where(
+                self.model.id.in_(ids[start : start + BATCH_SIZE])
+            )
+            result = cast(CursorResult[Any], session.execute(stmt))
+            removed += result.rowcount
+        self._commit(session)
+        return removed
+
+    def _apply(
+        self, db_obj: ModelType, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> None:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+        for field in update_data.keys():
+            setattr(db_obj, field, update_data[field])
+
+    def _commit(self, session: Session) -> None:
+        if in_unit_of_work(session):
+            session.flush()
+        else:
+            session.commit()
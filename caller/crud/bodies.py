@@ -0,0 +1,196 @@
+from collections import defaultdict
+from typing import Any, Mapping, Optional, cast
+
+from sqlalchemy import CursorResult, delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, undefer
+
+from caller import search
+from caller.blobs import blob_store
+from caller.codecs import Codec, decompress, encode
+from caller.config import settings
+from caller.crud.base import BATCH_SIZE, CRUDBase
+from caller.db import Body, Response
+from caller.schemas.bodies import BodyCreate, BodyUpdate
+
+
+class CRUDBody(CRUDBase[Body, BodyCreate, BodyUpdate]):
+    def get_by_hash(self, session: Session, *, hash: str) -> Optional[Body]:
+        stmt = select(Body).where(Body.hash == hash)
+        return session.execute(stmt).scalars().first()
+
+    def acquire(
+        self,
+        session: Session,
+        *,
+        hash: str,
+        content: Optional[bytes],
+        blob: bool,
+        size: int,
+        count: int = 1,
+    ) -> None:
+        """
+        Add `count` references to the body with `hash`, storing it first
+        if it is new. Does not commit
+        """
+        stmt = (
+            update(Body)
+            .where(Body.hash == hash)
+            .values(ref_count=Body.ref_count + count)
+            .execution_options(synchronize_session=False)
+        )
+        if cast(CursorResult[Any], session.execute(stmt)).rowcount > 0:
+            return
+
+        codec = None
+        stored = content
+        if content is not None:
+            stored, codec = encode(content, settings.codec, settings.compress_min_size)
+
+        insert_stmt = (
+            insert(Body)
+            .values(
+                hash=hash,
+                content=stored,
+                codec=codec,
+                blob=blob,
+                size=size,
+                ref_count=count,
+            )
+            .on_conflict_do_update(
+                index_elements=[Body.hash], set_={"ref_count": Body.ref_count + count}
+            )
+            .returning(Body.id, Body.ref_count)
+        )
+        body_id, ref_count = session.execute(insert_stmt).one()
+        # a concurrent insert of the same body was indexed by its writer
+        if ref_count == count:
+            search.index_body(
+                session, body_id, blob_store.open(hash) if blob else content
+            )
+
+    def release(self, session: Session, *, hash: str, count: int = 1) -> None:
+        """
+        Drop `count` references to the body with `hash` and delete it once
+        nothing refers to it. Blob files are left for `sweep_blobs`
+        """
+        stmt = (
+            update(Body)
+            .where(Body.hash == hash)
+            .values(ref_count=Body.ref_count - count)
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(stmt)
+
+        orphan = session.execute(
+            select(Body).where(Body.hash == hash, Body.ref_count <= 0)
+        ).scalar()
+        if orphan is None:
+            return
+
+        search.unindex_bodies(session, [orphan.id])
+        session.delete(orphan)
+
+    def release_many(self, session: Session, *, counts: Mapping[str, int]) -> None:
+        """
+        `release` for many bodies at once, with one UPDATE per distinct
+        count and batch of hashes instead of one per body
+        """
+        by_count: dict[int, list[str]] = defaultdict(list)
+        for hash, count in counts.items():
+            by_count[count].append(hash)
+        for count, hashes in by_count.items():
+            for start in range(0, len(hashes), BATCH_SIZE):
+                stmt = (
+                    update(Body)
+                    .where(Body.hash.in_(hashes[start : start + BATCH_SIZE]))
+                    .values(ref_count=Body.ref_count - count)
+                    .execution_options(synchronize_session=False)
+                )
+                session.execute(stmt)
+
+        hashes = list(counts)
+        for start in range(0, len(hashes), BATCH_SIZE):
+            orphans = (
+                session.execute(
+                    select(Body.id).where(
+                        Body.hash.in_(hashes[start : start + BATCH_SIZE]),
+                        Body.ref_count <= 0,
+                    )
+                )
+                .scalars()
+                .all()
+            )
+            if not orphans:
+                continue
+
+            search.unindex_bodies(session, orphans)
+            session.execute(delete(Body).where(Body.id.in_(orphans)))
+
+    def recompress(
+        self, session: Session, *, codec: Codec, batch_size: int = 500
+    ) -> int:
+        """
+        Re-encode every inline body with `codec`, committing once per batch.
+        Returns the number of rows that were rewritten
+        """
+        rewritten = 0
+        last_id = 0
+        while True:
+            stmt = (
+                select(Body)
+                .where(Body.id > last_id, Body.blob.is_(False))
+                .options(undefer(Body.content))
+                .order_by(Body.id)
+                .limit(batch_size)
+            )
+            batch = list(session.execute(stmt).scalars())
+            if not batch:
+                return rewritten
+
+            last_id = batch[-1].id
+            for body in batch:
+                if body.codec == codec:
+                    continue
+                raw = decompress(body.content or b"", body.codec)
+                content, body_codec = encode(raw, codec, settings.compress_min_size)
+                if body_codec == body.codec:
+                    continue
+                body.content = content
+                body.codec = body_codec
+                rewritten += 1
+
+            session.commit()
+            session.expunge_all()
+
+    def sweep_blobs(self, session: Session, *, grace: Optional[float] = None) -> int:
+        """
+        Delete blob files that no body (or row written before bodies were
+        deduplicated) refers to and that are older than `grace` seconds.
+        Files are never deleted as part of releasing a body, a concurrent
+        send may have just captured the same content again. Returns the
+        number of files deleted
+        """
+        grace = settings.blob_grace_period if grace is None else grace
+        deleted = 0
+        keys = list(blob_store.keys(older_than=grace))
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start : start + BATCH_SIZE]
+            referenced: set[Optional[str]] = set(
+                session.execute(select(Body.hash).where(Body.hash.in_(batch))).scalars()
+            )
+            referenced.update(
+                session.execute(
+                    select(Response.blob_key).where(Response.blob_key.in_(batch))
+                ).scalars()
+            )
+            for key in batch:
+                # re-captured since it was listed
+                if key in referenced or blob_store.age(key) < grace:
+                    continue
+                blob_store.delete(key)
+                deleted += 1
+        return deleted
+
+
+body_crud = CRUDBody(Body)
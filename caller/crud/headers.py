@@ -1,15 +1,70 @@
-from sqlalchemy import select
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import event, select, text
 from sqlalchemy.orm import Session
 
 from caller.crud.base import CRUDBase
 from caller.db import Header
-from caller.schemas.headers import HeaderCreate, HeaderUpdate
+from caller.schemas.headers import GlobalHeaderGet, HeaderCreate, HeaderUpdate
 
 
 class CRUDHeader(CRUDBase[Header, HeaderCreate, HeaderUpdate]):
-    def get_globals(self, session: Session) -> list[Header]:
-        stmt = select(Header).where(Header.api_call_id.is_(None))
-        return list(session.execute(stmt).scalars())
+    def __init__(self, model: type[Header]):
+        super().__init__(model)
+        self._lock = Lock()
+        self._globals: Optional[list[GlobalHeaderGet]] = None
+        self._globals_version: Optional[tuple[int, int]] = None
+
+    def get_globals(self, session: Session) -> list[GlobalHeaderGet]:
+        """
+        Global headers, cached for the whole process. The cache is dropped
+        on writes through this object and whenever another connection
+        (or process) has written to the database since it was filled
+        """
+        version = self._data_version(session)
+        with self._lock:
+            if self._globals is None or self._globals_version != version:
+                stmt = select(Header).where(Header.api_call_id.is_(None))
+                self._globals = [
+                    GlobalHeaderGet.from_orm(header)
+                    for header in session.execute(stmt).scalars()
+                ]
+                self._globals_version = version
+            return self._globals
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._globals = None
+
+    def _commit(self, session: Session) -> None:
+        # every create/update/remove, bulk or not, ends up here
+        session.info["headers_written"] = True
+        super()._commit(session)
+        self.invalidate()
+
+    @staticmethod
+    def _data_version(session: Session) -> tuple[int, int]:
+        """
+        `PRAGMA data_version` only changes for commits made by other
+        connections and is counted per connection, so it is paired with
+        the identity of the connection it was read from
+        """
+        conn = session.connection()
+        version = conn.execute(text("PRAGMA data_version")).scalar_one()
+        return id(conn.connection.dbapi_connection), version
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_headers(session: Session) -> None:
+    # a unit of work may have read its own uncommitted headers into the cache
+    if session.info.pop("headers_written", False):
+        header_crud.invalidate()
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_written_headers(session: Session) -> None:
+    session.info.pop("headers_written", None)
 
 
 header_crud = CRUDHeader(Header)
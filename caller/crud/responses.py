@@ -1,16 +1,276 @@
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+import hashlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Optional, Sequence
 
-from caller.crud.base import CRUDBase
-from caller.db import APICall, Response
+from sqlalchemy import func, literal, or_, select, tuple_
+from sqlalchemy.orm import Session, load_only, selectinload, undefer
+
+from caller import search
+from caller.codecs import decompress
+from caller.crud.base import CRUDBase, in_unit_of_work, unit_of_work
+from caller.crud.bodies import body_crud
+from caller.crud.rollups import rollup_crud
+from caller.db import APICall, Body, Response
 from caller.schemas.responses import ResponseCreate, ResponseUpdate
+from caller.schemas.retention import RetentionPolicy
 
 
 class CRUDResponse(CRUDBase[Response, ResponseCreate, ResponseUpdate]):
-    def get_by_api_call(self, session: Session, *, api_call: APICall) -> list[Response]:
-        stmt = select(Response).where(Response.api_call == api_call)
+    def create(self, session: Session, *, obj_in: ResponseCreate) -> Response:
+        with unit_of_work(session):
+            (stored,) = self._store_bodies(session, [obj_in])
+            db_obj = super().create(session, obj_in=stored)
+            search.index_responses(session, [(db_obj.id, obj_in)])
+            rollup_crud.record(session, responses=[obj_in])
+        if not in_unit_of_work(session):
+            session.refresh(db_obj)
+        return db_obj
+
+    def create_many(
+        self, session: Session, *, objs_in: Sequence[ResponseCreate]
+    ) -> list[Response]:
+        with unit_of_work(session):
+            stored = self._store_bodies(session, objs_in)
+            db_objs = super().create_many(session, objs_in=stored)
+            search.index_responses(
+                session,
+                [(db_obj.id, obj_in) for db_obj, obj_in in zip(db_objs, objs_in)],
+            )
+            rollup_crud.record(session, responses=objs_in)
+        return db_objs
+
+    def remove(self, session: Session, *, obj: Response) -> Response:
+        if obj.body_hash is not None:
+            body_crud.release(session, hash=obj.body_hash)
+        with unit_of_work(session):
+            search.unindex_responses(session, [obj.id])
+            return super().remove(session, obj=obj)
+
+    def remove_many(self, session: Session, *, objs: Sequence[Response]) -> int:
+        hashes = Counter(obj.body_hash for obj in objs if obj.body_hash is not None)
+        # the responses have to go first for the bodies foreign key to hold
+        with unit_of_work(session):
+            search.unindex_responses(session, [obj.id for obj in objs])
+            removed = super().remove_many(session, objs=objs)
+            body_crud.release_many(session, counts=hashes)
+        return removed
+
+    def _store_bodies(
+        self, session: Session, objs_in: Sequence[ResponseCreate]
+    ) -> list[ResponseCreate]:
+        """
+        Add references to the deduplicated copies of the bodies of
+        `objs_in` and return them pointing at those copies instead. Each
+        distinct body is acquired once however often it repeats
+        """
+        counts: Counter[str] = Counter()
+        firsts: dict[str, ResponseCreate] = {}
+        stored = []
+        for obj_in in objs_in:
+            if (
+                obj_in.content is None
+                and obj_in.blob_key is None
+                and obj_in.body_hash is None
+            ):
+                stored.append(obj_in)
+                continue
+
+            body_hash = obj_in.body_hash or obj_in.blob_key
+            if body_hash is None:
+                body_hash = hashlib.sha256(obj_in.content or b"").hexdigest()
+
+            counts[body_hash] += 1
+            firsts.setdefault(body_hash, obj_in)
+            stored.append(
+                obj_in.copy(
+                    update={
+                        "content": None,
+                        "content_codec": None,
+                        "blob_key": None,
+                        "body_hash": body_hash,
+                    }
+                )
+            )
+
+        for body_hash, count in counts.items():
+            obj_in = firsts[body_hash]
+            body_crud.acquire(
+                session,
+                hash=body_hash,
+                content=obj_in.content,
+                blob=obj_in.blob_key is not None,
+                size=obj_in.size or len(obj_in.content or b""),
+                count=count,
+            )
+        return stored
+
+    def get_by_api_call(
+        self,
+        session: Session,
+        *,
+        api_call: APICall,
+        before: Optional[tuple[datetime, int]] = None,
+        limit: int = 100,
+    ) -> list[Response]:
+        """
+        History of `api_call`, newest first. Pass the (timestamp, id) of
+        the last response of a page as `before` to get the next one.
+        Bodies are loaded for the whole page at once so listings can show
+        a preview
+        """
+        stmt = (
+            select(Response)
+            .where(Response.api_call_id == api_call.id)
+            .options(
+                undefer(Response.content),
+                selectinload(Response.stored_body).undefer(Body.content),
+            )
+            .order_by(Response.timestamp.desc(), Response.id.desc())
+            .limit(limit)
+        )
+        if before is not None:
+            stmt = stmt.where(tuple_(Response.timestamp, Response.id) < before)
         result = session.execute(stmt)
         return list(result.scalars())
 
+    def get_latest(
+        self,
+        session: Session,
+        *,
+        api_call_id: int,
+        codes: Optional[Collection[int]] = None,
+    ) -> Optional[Response]:
+        """
+        Newest response of an api call, optionally only among those with a
+        status in `codes`. The history index is walked newest first until a
+        row matches. The body is only read once `Response.body` is accessed
+        """
+        stmt = (
+            select(Response)
+            .where(Response.api_call_id == api_call_id)
+            .order_by(Response.timestamp.desc(), Response.id.desc())
+            .limit(1)
+        )
+        if codes is not None:
+            stmt = stmt.where(Response.code.in_(list(codes)))
+        return session.execute(stmt).scalars().first()
+
+    def prune(
+        self,
+        session: Session,
+        *,
+        api_call_id: int,
+        policy: RetentionPolicy,
+        now: Optional[datetime] = None,
+        batch_size: int = 500,
+    ) -> int:
+        """
+        Delete the responses of an api call that `policy` does not keep,
+        committing once per batch. Returns the number of rows deleted
+        """
+        if (
+            policy.keep_last is None
+            and policy.keep_days is None
+            and not policy.downsample_hourly
+        ):
+            return 0
+
+        cutoff = None
+        if policy.keep_days is not None:
+            now = now or datetime.now(timezone.utc)
+            cutoff = now - timedelta(days=policy.keep_days)
+        expired = Response.timestamp < cutoff if cutoff is not None else literal(True)
+        hour = func.strftime("%Y-%m-%d %H", Response.timestamp)
+
+        # walk the history newest first by a keyset on (timestamp, id) so
+        # every batch costs the same no matter how long the history is
+        pruned = 0
+        position = 0
+        last_hour = None
+        before: Optional[tuple[datetime, int]] = None
+        while True:
+            stmt = (
+                select(Response, hour, expired)
+                .where(Response.api_call_id == api_call_id)
+                .options(
+                    load_only(Response.timestamp, Response.body_hash, Response.code)
+                )
+                .order_by(Response.timestamp.desc(), Response.id.desc())
+                .limit(batch_size)
+            )
+            if before is not None:
+                stmt = stmt.where(tuple_(Response.timestamp, Response.id) < before)
+            rows = session.execute(stmt).all()
+            if not rows:
+                return pruned
+
+            doomed = []
+            for response, response_hour, response_expired in rows:
+                position += 1
+                newest_of_hour = response_hour != last_hour
+                last_hour = response_hour
+                if policy.keep_last is not None and position <= policy.keep_last:
+                    continue
+                if not response_expired:
+                    continue
+                if policy.downsample_hourly and newest_of_hour:
+                    continue
+                if policy.keep_errors and not 200 <= response.code <= 299:
+                    continue
+                doomed.append(response)
+
+            before = (rows[-1][0].timestamp, rows[-1][0].id)
+            if doomed:
+                pruned += self.remove_many(session, objs=doomed)
+
+    def migrate_bodies(self, session: Session, *, batch_size: int = 500) -> int:
+        """
+        Move bodies of rows written before deduplication into the bodies
+        table, committing once per batch. Returns the number of rows moved
+        """
+        moved = 0
+        last_id = 0
+        while True:
+            stmt = (
+                select(Response)
+                .where(
+                    Response.id > last_id,
+                    Response.body_hash.is_(None),
+                    or_(Response.content.is_not(None), Response.blob_key.is_not(None)),
+                )
+                .options(undefer(Response.content))
+                .order_by(Response.id)
+                .limit(batch_size)
+            )
+            batch = list(session.execute(stmt).scalars())
+            if not batch:
+                return moved
+
+            last_id = batch[-1].id
+            for response in batch:
+                content = None
+                if response.content is not None:
+                    content = decompress(response.content, response.content_codec)
+                body_hash = (
+                    response.blob_key or hashlib.sha256(content or b"").hexdigest()
+                )
+
+                body_crud.acquire(
+                    session,
+                    hash=body_hash,
+                    content=content,
+                    blob=response.blob_key is not None,
+                    size=response.size or len(content or b""),
+                )
+                response.body_hash = body_hash
+                response.content = None
+                response.content_codec = None
+                response.blob_key = None
+                moved += 1
+
+            session.commit()
+            session.expunge_all()
+
 
 response_crud = CRUDResponse(Response)
@@ -0,0 +1,158 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Sequence, Union
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, load_only
+
+from caller.crud.base import CRUDBase
+from caller.db import Response, Rollup
+from caller.enums import Period
+from caller.schemas.responses import ResponseCreate
+from caller.schemas.rollups import RollupCreate, RollupUpdate
+from caller.stats import LatencySketch, Stats, period_start
+
+
+class CRUDRollup(CRUDBase[Rollup, RollupCreate, RollupUpdate]):
+    def record(
+        self, session: Session, *, responses: Sequence[Union[Response, ResponseCreate]]
+    ) -> None:
+        """
+        Fold `responses` into the hourly and daily rollups of their api
+        calls, one upsert per rollup touched. Does not commit
+        """
+        batches: dict[tuple[int, Period, datetime], Stats] = defaultdict(Stats)
+        for response in responses:
+            for period in Period:
+                start = period_start(response.timestamp, period)
+                batches[response.api_call_id, period, start].add(
+                    response.code, response.total_ms
+                )
+        for (api_call_id, period, start), stats in batches.items():
+            self._merge(
+                session,
+                api_call_id=api_call_id,
+                period=period,
+                start=start,
+                stats=stats,
+            )
+
+    def _merge(
+        self,
+        session: Session,
+        *,
+        api_call_id: int,
+        period: Period,
+        start: datetime,
+        stats: Stats,
+    ) -> None:
+        stmt = insert(Rollup).values(
+            api_call_id=api_call_id,
+            period=period,
+            start=start,
+            count=stats.count,
+            errors=stats.errors,
+            timed=stats.timed,
+            min_ms=stats.min_ms,
+            max_ms=stats.max_ms,
+            sum_ms=stats.sum_ms,
+            sketch=stats.sketch.to_json(),
+        )
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Rollup.api_call_id, Rollup.period, Rollup.start],
+            set_={
+                "count": Rollup.count + new.count,
+                "errors": Rollup.errors + new.errors,
+                "timed": Rollup.timed + new.timed,
+                # two argument min/max are NULL if either side is
+                "min_ms": func.min(
+                    func.coalesce(Rollup.min_ms, new.min_ms),
+                    func.coalesce(new.min_ms, Rollup.min_ms),
+                ),
+                "max_ms": func.max(
+                    func.coalesce(Rollup.max_ms, new.max_ms),
+                    func.coalesce(new.max_ms, Rollup.max_ms),
+                ),
+                "sum_ms": Rollup.sum_ms + new.sum_ms,
+            },
+        ).returning(Rollup.id, Rollup.count, Rollup.sketch)
+        rollup_id, count, sketch = session.execute(stmt).one()
+        if count == stats.count:
+            return
+
+        # the row already existed and its sketch was left as it was, sketches
+        # are merged here as sqlite cannot add up the bins of two json objects
+        merged = LatencySketch.from_json(sketch)
+        merged.merge(stats.sketch)
+        session.execute(
+            update(Rollup)
+            .where(Rollup.id == rollup_id)
+            .values(sketch=merged.to_json())
+            .execution_options(synchronize_session=False)
+        )
+
+    def get_since(
+        self, session: Session, *, api_call_id: int, period: Period, since: datetime
+    ) -> list[Rollup]:
+        """
+        Rollups of an api call starting at or after `since`, newest
+        first. Costs the same however many responses they cover
+        """
+        stmt = (
+            select(Rollup)
+            .where(
+                Rollup.api_call_id == api_call_id,
+                Rollup.period == period,
+                Rollup.start >= period_start(since, period),
+            )
+            .order_by(Rollup.start.desc())
+        )
+        return list(session.execute(stmt).scalars())
+
+    def remove_by_api_call(self, session: Session, *, api_call_id: int) -> None:
+        """
+        Does not commit, meant for removing an api call along with
+        everything that belongs to it
+        """
+        session.execute(delete(Rollup).where(Rollup.api_call_id == api_call_id))
+
+    def rebuild(self, session: Session, *, batch_size: int = 500) -> int:
+        """
+        Recompute every rollup from the stored responses, committing once
+        per batch. Responses that were already pruned are lost from the
+        rollups for good. Returns the number of responses counted
+        """
+        session.execute(delete(Rollup))
+        session.commit()
+
+        counted = 0
+        last_id = 0
+        while True:
+            stmt = (
+                select(Response)
+                .where(Response.id > last_id)
+                .options(
+                    load_only(
+                        Response.api_call_id,
+                        Response.timestamp,
+                        Response.code,
+                        Response.total_ms,
+                    )
+                )
+                .order_by(Response.id)
+                .limit(batch_size)
+            )
+            batch = list(session.execute(stmt).scalars())
+            if not batch:
+                return counted
+
+            last_id = batch[-1].id
+            self.record(session, responses=batch)
+            counted += len(batch)
+            session.commit()
+            session.expunge_all()
+
+
+rollup_crud = CRUDRollup(Rollup)
@@ -1,11 +1,26 @@
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Optional
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, Table
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Engine,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    Table,
+    UniqueConstraint,
+    inspect,
+    text,
+)
 from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-from caller.enums import Method
+from caller.blobs import Buffer, blob_store
+from caller.codecs import Codec, decompress, decompress_head
+from caller.enums import Method, Period
+from caller.timing import Timings
 
 
 class Base(DeclarativeBase):
@@ -14,15 +29,38 @@ class Base(DeclarativeBase):
 
 class APICall(Base):
     __tablename__ = "api_calls"
+    __table_args__ = (
+        Index(
+            "ix_api_calls_import_key",
+            "import_key",
+            sqlite_where=text("import_key IS NOT NULL"),
+        ),
+    )
 
     name: Mapped[str]
     url: Mapped[Optional[str]]
     method: Mapped[Method] = mapped_column(Enum(Method), default=Method.GET)
     content: Mapped[Optional[str]]
+    timeout: Mapped[Optional[float]]
+    tags: Mapped[Optional[list[str]]] = mapped_column(JSON)
+    use_cache: Mapped[bool] = mapped_column(default=False, server_default="0")
+    retry_policy: Mapped[Optional[dict[str, Any]]] = mapped_column(JSON)
+    retention_policy: Mapped[Optional[dict[str, Any]]] = mapped_column(JSON)
+    # where an imported call came from and what it looked like there, so
+    # importing the same spec or capture again only touches what changed
+    import_key: Mapped[Optional[str]]
+    import_hash: Mapped[Optional[str]]
 
-    responses: Mapped[list["Response"]] = relationship(back_populates="api_call")
-    headers: Mapped[list["Header"]] = relationship(back_populates="api_call")
-    parameters: Mapped[list["Parameter"]] = relationship(back_populates="api_call")
+    # history can be huge so it is only ever read through response_crud
+    responses: Mapped[list["Response"]] = relationship(
+        back_populates="api_call", lazy="raise", passive_deletes=True
+    )
+    headers: Mapped[list["Header"]] = relationship(
+        back_populates="api_call", cascade="all, delete-orphan"
+    )
+    parameters: Mapped[list["Parameter"]] = relationship(
+        back_populates="api_call", cascade="all, delete-orphan"
+    )
 
     def __str__(self) -> str:
         # fmt: off
@@ -31,6 +69,11 @@ class APICall(Base):
             f"url={self.url}",
             f"method={self.method}",
             f"content={self.content}",
+            f"timeout={self.timeout}",
+            f"tags={','.join(self.tags or [])}",
+            f"use_cache={self.use_cache}",
+            f"retry_policy={self.retry_policy}",
+            f"retention_policy={self.retention_policy}",
         ])
         # fmt: on
 
@@ -45,6 +88,15 @@ req_headers = Table(
 
 class Header(Base):
     __tablename__ = "headers"
+    __table_args__ = (
+        # global headers are looked up on every send, everything else by call
+        Index("ix_headers_global", "key", sqlite_where=text("api_call_id IS NULL")),
+        Index(
+            "ix_headers_api_call_id",
+            "api_call_id",
+            sqlite_where=text("api_call_id IS NOT NULL"),
+        ),
+    )
 
     key: Mapped[str]
     value: Mapped[str]
@@ -59,33 +111,263 @@ class Parameter(Base):
     key: Mapped[str]
     value: Mapped[str]
 
-    api_call_id: Mapped[int] = mapped_column(ForeignKey("api_calls.id"))
+    api_call_id: Mapped[int] = mapped_column(ForeignKey("api_calls.id"), index=True)
     api_call: Mapped[APICall] = relationship(back_populates="parameters")
 
 
+class Body(Base):
+    """
+    Response body stored once per distinct content. Large bodies live in
+    the blob store under the same hash and only their metadata is kept here
+    """
+
+    __tablename__ = "bodies"
+
+    hash: Mapped[str] = mapped_column(unique=True)
+    content: Mapped[Optional[bytes]] = mapped_column(deferred=True)
+    codec: Mapped[Optional[Codec]] = mapped_column(Enum(Codec))
+    blob: Mapped[bool] = mapped_column(default=False)
+    size: Mapped[int]
+    ref_count: Mapped[int] = mapped_column(default=0)
+
+    def read(self) -> Buffer:
+        if self.blob:
+            return blob_store.open(self.hash)
+        return decompress(self.content or b"", self.codec)
+
+    def head(self, size: int) -> bytes:
+        if self.blob:
+            return blob_store.head(self.hash, size)
+        return decompress_head(self.content or b"", self.codec, size)
+
+
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        Index(
+            "ix_responses_blob_key",
+            "blob_key",
+            sqlite_where=text("blob_key IS NOT NULL"),
+        ),
+    )
 
     timestamp: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        index=True,
     )
     code: Mapped[int]
-    content: Mapped[Optional[bytes]]
+    # bodies are only read on demand, history listings stay metadata only
+    content: Mapped[Optional[bytes]] = mapped_column(deferred=True)
+    content_codec: Mapped[Optional[Codec]] = mapped_column(Enum(Codec))
+    blob_key: Mapped[Optional[str]]
+    size: Mapped[Optional[int]]
+    truncated: Mapped[Optional[bool]]
     url: Mapped[str]
     method: Mapped[Method]
 
     data: Mapped[Optional[dict[str, dict[str, str]]]] = mapped_column(JSON)
 
+    connect_ms: Mapped[Optional[float]]
+    tls_ms: Mapped[Optional[float]]
+    ttfb_ms: Mapped[Optional[float]]
+    download_ms: Mapped[Optional[float]]
+    total_ms: Mapped[Optional[float]]
+    request_bytes: Mapped[Optional[int]]
+    response_bytes: Mapped[Optional[int]]
+
+    body_hash: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("bodies.hash"), index=True
+    )
+    stored_body: Mapped[Optional[Body]] = relationship()
+
     api_call_id: Mapped[int] = mapped_column(ForeignKey("api_calls.id"))
     api_call: Mapped[APICall] = relationship(back_populates="responses")
 
+    @property
+    def body(self) -> Optional[Buffer]:
+        """
+        Inline content or a read-only memory map of the stored blob.
+        `content`, `content_codec` and `blob_key` are only set on rows
+        written before bodies were deduplicated
+        """
+        if self.stored_body is not None:
+            return self.stored_body.read()
+        if self.blob_key is not None:
+            return blob_store.open(self.blob_key)
+        if self.content is None:
+            return None
+        return decompress(self.content, self.content_codec)
+
+    def head(self, size: int) -> Optional[bytes]:
+        """
+        The first `size` bytes of the body, without reading the rest
+        """
+        if self.stored_body is not None:
+            return self.stored_body.head(size)
+        if self.blob_key is not None:
+            return blob_store.head(self.blob_key, size)
+        if self.content is None:
+            return None
+        return decompress_head(self.content, self.content_codec, size)
+
     def __str__(self) -> str:
         string = f"{self.timestamp}: id={self.id}, code={self.code}"
-        if self.content is not None:
-            trunc_content = (
-                (self.content.decode()[:50] + "...")
-                if len(self.content) > 75
-                else self.content.decode()
-            )
+        if (head := self.head(76)) is not None:
+            preview = head[:75].decode(errors="replace")
+            trunc_content = preview[:50] + "..." if len(head) > 75 else preview
             string += f", content={trunc_content}"
+        if self.size is not None and self.size > 75:
+            string += f", size={self.size}"
+        if self.truncated:
+            string += " (truncated)"
+        if self.total_ms is not None:
+            string += f", {self.timings}"
         return string
+
+    @property
+    def timings(self) -> Timings:
+        return Timings(
+            connect_ms=self.connect_ms,
+            tls_ms=self.tls_ms,
+            ttfb_ms=self.ttfb_ms,
+            download_ms=self.download_ms,
+            total_ms=self.total_ms,
+            request_bytes=self.request_bytes,
+            response_bytes=self.response_bytes,
+        )
+
+
+# history of an api call, newest first
+Index(
+    "ix_responses_api_call_id_timestamp",
+    Response.api_call_id,
+    Response.timestamp.desc(),
+    Response.id.desc(),
+)
+
+
+class Rollup(Base):
+    """
+    Counts and latencies of the responses of an api call in one hour or
+    day. Updated as responses are stored and kept when they are pruned
+    """
+
+    __tablename__ = "rollups"
+    __table_args__ = (UniqueConstraint("api_call_id", "period", "start"),)
+
+    api_call_id: Mapped[int] = mapped_column(ForeignKey("api_calls.id"))
+    period: Mapped[Period] = mapped_column(Enum(Period))
+    start: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    count: Mapped[int]
+    errors: Mapped[int]
+    timed: Mapped[int]
+    min_ms: Mapped[Optional[float]]
+    max_ms: Mapped[Optional[float]]
+    sum_ms: Mapped[float]
+    # caller.stats.LatencySketch bins
+    sketch: Mapped[dict[str, int]] = mapped_column(JSON)
+
+
+def init_db(engine: Engine) -> None:
+    Base.metadata.create_all(engine)
+    _add_missing_columns(engine)
+    _add_missing_indexes(engine)
+    _create_search_tables(engine)
+
+
+def _add_missing_columns(engine: Engine) -> None:
+    """
+    `create_all` only creates missing tables so columns added to
+    existing models are appended to older databases here
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                ddl += column.type.compile(engine.dialect)
+                if column.server_default is not None:
+                    default = column.server_default.arg  # type: ignore
+                    ddl += f" DEFAULT {getattr(default, 'text', default)}"
+                conn.execute(text(ddl))
+
+
+def _add_missing_indexes(engine: Engine) -> None:
+    """
+    Like columns, indexes declared on existing tables are not created by
+    `create_all` on older databases
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+# fmt: off
+SEARCH_DDL = [
+    # superseded by bodies_fts and response_headers_fts
+    """
+    DROP TABLE IF EXISTS responses_fts
+    """,
+    # one row per distinct body, rowid is bodies.id
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS bodies_fts USING fts5(body)
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS response_headers_fts USING fts5(headers)
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_calls_fts USING fts5(
+        name, url, content, content='api_calls', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_calls_fts_insert AFTER INSERT ON api_calls
+    BEGIN
+        INSERT INTO api_calls_fts(rowid, name, url, content)
+        VALUES (new.id, new.name, new.url, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_calls_fts_delete AFTER DELETE ON api_calls
+    BEGIN
+        INSERT INTO api_calls_fts(api_calls_fts, rowid, name, url, content)
+        VALUES ('delete', old.id, old.name, old.url, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_calls_fts_update
+    AFTER UPDATE OF name, url, content ON api_calls
+    BEGIN
+        INSERT INTO api_calls_fts(api_calls_fts, rowid, name, url, content)
+        VALUES ('delete', old.id, old.name, old.url, old.content);
+        INSERT INTO api_calls_fts(rowid, name, url, content)
+        VALUES (new.id, new.name, new.url, new.content);
+    END
+    """,
+]
+# fmt: on
+
+
+def _create_search_tables(engine: Engine) -> None:
+    """
+    FTS5 tables used by `caller.search`. The api call index reads from
+    api_calls and is kept in sync by triggers. Bodies are indexed once per
+    distinct body by body_crud and response headers by response_crud
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'api_calls_fts'")
+        ).first()
+        for ddl in SEARCH_DDL:
+            conn.execute(text(ddl))
+        if exists is None:
+            conn.execute(
+                text("INSERT INTO api_calls_fts(api_calls_fts) VALUES ('rebuild')")
+            )
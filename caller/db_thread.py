@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Concatenate, ParamSpec, TypeVar
+
+from sqlalchemy.orm import Session
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class SessionThread:
+    """
+    Owns a sync `Session` and runs everything that touches it on one
+    dedicated thread, so an event loop can await database work instead
+    of blocking on it. Any CRUD method (or function taking the session
+    first) can be run, e.g.
+    `await db.run(api_call_crud.get_page, limit=100)`
+
+    Objects it returns are read on other threads, so the session should
+    not expire them on commit and anything lazy has to be loaded inside
+    the function that is run
+    """
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+    async def run(
+        self,
+        fn: Callable[Concatenate[Session, P], T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(fn, self.session, *args, **kwargs)
+        )
+
+    def close(self) -> None:
+        """
+        Wait for queued work to finish. The session itself is left to
+        whoever created it
+        """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Any, Optional
+
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.orm import Session
+
+from caller.config import settings
+from caller.db import init_db
+
+_engines: dict[Path, Engine] = {}
+
+
+def _set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    # only takes effect on a fresh database (or after a VACUUM)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    # negative means KiB instead of pages
+    cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def get_engine(db: Optional[Path] = None, *, echo: bool = False) -> Engine:
+    """
+    Return the engine for the database at `db` (settings.db by default),
+    creating it and its tables on first use
+    """
+    path = (db or settings.db).resolve()
+    if (engine := _engines.get(path)) is None:
+        engine = create_engine(f"sqlite:///{path}", echo=echo)
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        init_db(engine)
+        _engines[path] = engine
+    return engine
+
+
+def get_session(
+    db: Optional[Path] = None, *, echo: bool = False, expire_on_commit: bool = True
+) -> Session:
+    return Session(get_engine(db, echo=echo), expire_on_commit=expire_on_commit)
+
+
+def dispose_engines() -> None:
+    for engine in _engines.values():
+        engine.dispose()
+    _engines.clear()
@@ -57,3 +57,8 @@ class Method(StrEnum):
     PUT = auto()
     DELETE = auto()
     OPTIONS = auto()
+
+
+class Period(StrEnumLower):
+    HOUR = auto()
+    DAY = auto()
@@ -0,0 +1,301 @@
+import hashlib
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from pydantic.json import pydantic_encoder
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from caller.crud import api_call_crud, header_crud, parameter_crud, unit_of_work
+from caller.crud.base import BATCH_SIZE
+from caller.db import APICall, Header, Parameter
+from caller.enums import Method
+from caller.schemas.api_calls import APICallCreate
+from caller.schemas.headers import HeaderCreate
+from caller.schemas.parameters import ParameterCreate
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None  # type: ignore[assignment]
+
+# fields that come from the imported document, everything else (cache,
+# retry and retention policies, timeout) is left alone on re-import
+IMPORTED_FIELDS = {"name", "url", "method", "content", "tags", "import_hash"}
+
+# set by the client or meaningless outside the captured connection
+HAR_SKIPPED_HEADERS = {"host", "content-length", "connection"}
+
+
+@dataclass
+class ImportedCall:
+    key: str
+    api_call: APICallCreate
+    headers: list[tuple[str, str]] = field(default_factory=list)
+    parameters: list[tuple[str, str]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        definition = {
+            "api_call": self.api_call.dict(include=IMPORTED_FIELDS - {"import_hash"}),
+            "headers": self.headers,
+            "parameters": self.parameters,
+        }
+        digest = hashlib.sha256(
+            json.dumps(definition, sort_keys=True, default=pydantic_encoder).encode()
+        ).hexdigest()
+        self.api_call = self.api_call.copy(
+            update={"import_key": self.key, "import_hash": digest}
+        )
+
+
+def load_document(path: Path) -> Any:
+    """
+    JSON, or YAML when the file says so and pyyaml is installed
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.suffix.lower() not in (".yaml", ".yml"):
+            return json.load(f)
+        if yaml is None:
+            raise RuntimeError(
+                "YAML documents require the 'pyyaml' package,"
+                " install caller with the yaml extra"
+            )
+        return yaml.safe_load(f)
+
+
+def openapi_calls(
+    spec: dict[str, Any], *, base_url: Optional[str] = None
+) -> Iterator[ImportedCall]:
+    """
+    One api call per operation of an OpenAPI 3 document. Path templates
+    are kept as they are, query and header parameters are added when
+    they are required or come with an example or default
+    """
+    if not str(spec.get("openapi", "")).startswith("3"):
+        raise ValueError("not an OpenAPI 3 document")
+
+    title = spec.get("info", {}).get("title", "")
+    base_url = (base_url or _server_url(spec)).rstrip("/")
+    for path, path_item in spec.get("paths", {}).items():
+        path_item = _resolve(spec, path_item)
+        for method in Method:
+            operation = path_item.get(method.value.lower())
+            if operation is None:
+                continue
+
+            headers = []
+            parameters = []
+            for param in _parameters(spec, path_item, operation):
+                value = _example(param)
+                if value is None:
+                    if not param.get("required"):
+                        continue
+                    value = ""
+                if param["in"] == "query":
+                    parameters.append((param["name"], value))
+                elif param["in"] == "header":
+                    headers.append((param["name"], value))
+
+            content = None
+            body = _resolve(spec, operation.get("requestBody", {}))
+            if media := _media_example(body.get("content", {})):
+                media_type, content = media
+                headers.append(("Content-Type", media_type))
+
+            yield ImportedCall(
+                key=f"openapi:{title}:{method.value} {path}",
+                api_call=APICallCreate(
+                    name=operation.get("operationId") or f"{method.value} {path}",
+                    url=base_url + path,
+                    method=method,
+                    content=content,
+                    tags=operation.get("tags"),
+                ),
+                headers=headers,
+                parameters=parameters,
+            )
+
+
+def har_calls(har: dict[str, Any]) -> Iterator[ImportedCall]:
+    """
+    One api call per distinct method and url (without the query) in a
+    HAR capture. Later requests to the same url replace earlier ones
+    """
+    for entry in har["log"]["entries"]:
+        request = entry["request"]
+        try:
+            method = Method(request["method"].upper())
+        except ValueError:
+            continue
+
+        url = urlsplit(request["url"])
+        bare_url = urlunsplit((url.scheme, url.netloc, url.path, "", ""))
+        headers = [
+            (header["name"], header["value"])
+            for header in request.get("headers", [])
+            if not header["name"].startswith(":")
+            and header["name"].lower() not in HAR_SKIPPED_HEADERS
+        ]
+        parameters = [
+            (param["name"], param["value"]) for param in request.get("queryString", [])
+        ]
+        yield ImportedCall(
+            key=f"har:{method.value} {bare_url}",
+            api_call=APICallCreate(
+                name=f"{method.value} {url.path or '/'}",
+                url=bare_url,
+                method=method,
+                content=request.get("postData", {}).get("text"),
+            ),
+            headers=headers,
+            parameters=parameters,
+        )
+
+
+def import_calls(
+    session: Session, calls: Iterable[ImportedCall], *, batch_size: int = 500
+) -> Counter[str]:
+    """
+    Create or update api calls with their headers and parameters, one
+    transaction per batch of `batch_size`. Calls imported before whose
+    definition has not changed are skipped. Returns how many were
+    created, updated and unchanged
+    """
+    counts: Counter[str] = Counter()
+    batch: dict[str, ImportedCall] = {}
+    for call in calls:
+        batch[call.key] = call
+        if len(batch) >= batch_size:
+            _import_batch(session, batch, counts)
+            batch = {}
+    _import_batch(session, batch, counts)
+    return counts
+
+
+def _import_batch(
+    session: Session, batch: dict[str, ImportedCall], counts: Counter[str]
+) -> None:
+    if not batch:
+        return
+
+    keys = list(batch)
+    existing: dict[str, tuple[int, Optional[str]]] = {}
+    for start in range(0, len(keys), BATCH_SIZE):
+        stmt = select(APICall.import_key, APICall.id, APICall.import_hash).where(
+            APICall.import_key.in_(keys[start : start + BATCH_SIZE])
+        )
+        existing.update(
+            (key, (id, import_hash)) for key, id, import_hash in session.execute(stmt)
+        )
+
+    new = [call for key, call in batch.items() if key not in existing]
+    changed = {
+        existing[key][0]: call
+        for key, call in batch.items()
+        if key in existing and existing[key][1] != call.api_call.import_hash
+    }
+    with unit_of_work(session):
+        created = api_call_crud.create_many(
+            session, objs_in=[call.api_call for call in new]
+        )
+        if changed:
+            db_objs = list(
+                session.scalars(select(APICall).where(APICall.id.in_(list(changed))))
+            )
+            api_call_crud.update_many(
+                session,
+                db_objs=db_objs,
+                objs_in=[
+                    changed[db_obj.id].api_call.dict(include=IMPORTED_FIELDS)
+                    for db_obj in db_objs
+                ],
+            )
+            # headers and parameters are replaced wholesale
+            ids = list(changed)
+            session.execute(delete(Header).where(Header.api_call_id.in_(ids)))
+            session.execute(delete(Parameter).where(Parameter.api_call_id.in_(ids)))
+
+        written = [(db_obj.id, call) for db_obj, call in zip(created, new)]
+        written += list(changed.items())
+        header_crud.create_many(
+            session,
+            objs_in=[
+                HeaderCreate(key=key, value=value, api_call_id=api_call_id)
+                for api_call_id, call in written
+                for key, value in call.headers
+            ],
+        )
+        parameter_crud.create_many(
+            session,
+            objs_in=[
+                ParameterCreate(key=key, value=value, api_call_id=api_call_id)
+                for api_call_id, call in written
+                for key, value in call.parameters
+            ],
+        )
+    session.expunge_all()
+
+    counts["created"] += len(new)
+    counts["updated"] += len(changed)
+    counts["unchanged"] += len(batch) - len(new) - len(changed)
+
+
+def _resolve(spec: dict[str, Any], obj: dict[str, Any]) -> dict[str, Any]:
+    """
+    Follow local `$ref`s such as "#/components/parameters/limit"
+    """
+    while "$ref" in obj:
+        ref = obj["$ref"]
+        if not ref.startswith("#/"):
+            raise ValueError(f"only local references are supported, not {ref}")
+        obj = spec
+        for part in ref[2:].split("/"):
+            obj = obj[part.replace("~1", "/").replace("~0", "~")]
+    return obj
+
+
+def _server_url(spec: dict[str, Any]) -> str:
+    servers = spec.get("servers") or [{"url": ""}]
+    url = servers[0]["url"]
+    for name, variable in servers[0].get("variables", {}).items():
+        url = url.replace(f"{{{name}}}", str(variable.get("default", "")))
+    return url
+
+
+def _parameters(
+    spec: dict[str, Any], path_item: dict[str, Any], operation: dict[str, Any]
+) -> list[dict[str, Any]]:
+    # operation parameters override path ones with the same name and location
+    params = {}
+    for param in path_item.get("parameters", []) + operation.get("parameters", []):
+        param = _resolve(spec, param)
+        params[param["name"], param["in"]] = param
+    return list(params.values())
+
+
+def _example(obj: dict[str, Any]) -> Optional[str]:
+    """
+    Example (or default) value of a parameter or media type as a string
+    """
+    value = obj.get("example")
+    if value is None and obj.get("examples"):
+        value = next(iter(obj["examples"].values())).get("value")
+    schema = obj.get("schema", {})
+    if value is None:
+        value = schema.get("example", schema.get("default"))
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _media_example(content: dict[str, Any]) -> Optional[tuple[str, str]]:
+    # json is what caller sends best, so prefer it when there is a choice
+    media_types = sorted(content, key=lambda media_type: "json" not in media_type)
+    for media_type in media_types:
+        if (example := _example(content[media_type])) is not None:
+            return media_type, example
+    return None
@@ -1,6 +1,5 @@
 import json
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
 from enum import auto
 from typing import Callable, Optional
 
@@ -9,25 +8,27 @@ import typer
 from pydantic import AnyUrl, ValidationError
 from rich import print
 from rich.console import Console
-from rich.prompt import Prompt
-from sqlalchemy import Enum, create_engine
+from rich.prompt import Confirm, FloatPrompt, IntPrompt, Prompt
+from sqlalchemy import Enum
 from sqlalchemy.orm import Session
 
+from caller.blobs import blob_store
+from caller.cache import CacheStatus
+from caller.client import close_client, get_client
+from caller.config import settings
 from caller.crud.api_calls import api_call_crud
 from caller.crud.headers import header_crud
 from caller.crud.parameters import parameter_crud
 from caller.crud.responses import response_crud
-from caller.db import APICall, Base
+from caller.db import APICall
+from caller.engine import get_session
 from caller.enums import Method, StrEnumLower
-from caller.schemas.api_calls import (
-    APICallCreate,
-    APICallGet,
-    APICallReady,
-    APICallUpdate,
-)
+from caller.schemas.api_calls import APICallCreate, APICallGet, APICallUpdate
 from caller.schemas.headers import HeaderCreate
 from caller.schemas.parameters import ParameterCreate
-from caller.schemas.responses import ResponseCreate, ResponseData
+from caller.schemas.retention import RetentionPolicy
+from caller.schemas.retry import RetryPolicy
+from caller.sender import prepare, save_response, send
 
 
 @dataclass
@@ -104,12 +105,18 @@ class MainMenu(AppMenu):
         api_call_crud.create(self.session, obj_in=create_obj)
 
     def _list_api_calls(self) -> None:
-        # TODO: Pagination?
-        api_calls = api_call_crud.get_multi(self.session)
-
         print()
-        for api_call in api_calls:
-            print(f"{api_call.id}: {APICallGet.from_orm(api_call)}")
+        after = None
+        while True:
+            api_calls = api_call_crud.get_page(
+                self.session, after=after, limit=settings.page_size
+            )
+            for api_call in api_calls:
+                print(f"{api_call.id}: {APICallGet.from_orm(api_call)}")
+
+            if len(api_calls) < settings.page_size or not Confirm.ask("show more?"):
+                break
+            after = api_calls[-1].id
 
         print()
 
@@ -143,6 +150,11 @@ class APICallMenu(AppMenu):
             (self._set_url, "set url"),
             (self._set_method, "set method"),
             (self._set_content, "set content raw"),
+            (self._set_timeout, "set timeout"),
+            (self._set_tags, "set tags"),
+            (self._toggle_cache, "toggle http cache"),
+            (self._set_retry_policy, "set retry policy"),
+            (self._set_retention_policy, "set retention policy"),
             (self._add_json_content, "set content interactive"),
             (self._add_header, "add header"),
             (self._delete_header, "delete header"),
@@ -209,10 +221,10 @@ class APICallMenu(AppMenu):
             for header in self.selected_api_call.headers:
                 self.console.print(f"{header.id}: {header.key}={header.value}")
 
-        if len(headers := header_crud.get_globals(self.session)) > 0:
+        if len(g_headers := header_crud.get_globals(self.session)) > 0:
             self.console.print("GLOBAL HEADERS:")
-            for header in headers:
-                self.console.print(f"{header.id}: {header.key}={header.value}")
+            for g_header in g_headers:
+                self.console.print(f"{g_header.id}: {g_header.key}={g_header.value}")
 
         print()
         if len(self.selected_api_call.parameters) > 0:
@@ -238,21 +250,102 @@ class APICallMenu(AppMenu):
             obj_in=APICallUpdate(content=content),
         )
 
-    def _list_responses(self) -> None:
-        # TODO: Pagination?
-        responses = response_crud.get_by_api_call(
-            self.session, api_call=self.selected_api_call
+    def _set_timeout(self) -> None:
+        timeout = FloatPrompt.ask("timeout (seconds)", default=settings.timeout)
+        api_call_crud.update(
+            self.session,
+            db_obj=self.selected_api_call,
+            obj_in=APICallUpdate(timeout=timeout),
         )
 
+    def _set_tags(self) -> None:
+        tags = Prompt.ask("tags (comma separated)")
+        api_call_crud.update(
+            self.session,
+            db_obj=self.selected_api_call,
+            # the schema splits the comma separated string
+            obj_in=APICallUpdate.parse_obj({"tags": tags}),
+        )
+
+    def _toggle_cache(self) -> None:
+        api_call_crud.update(
+            self.session,
+            db_obj=self.selected_api_call,
+            obj_in=APICallUpdate(use_cache=not self.selected_api_call.use_cache),
+        )
+
+    def _set_retry_policy(self) -> None:
+        if not Confirm.ask("retry failed sends?"):
+            retry_policy = None
+        else:
+            default = RetryPolicy()
+            statuses = Prompt.ask(
+                "retry on status codes",
+                default=",".join(str(code) for code in default.statuses),
+            )
+            retry_policy = RetryPolicy(
+                max_attempts=IntPrompt.ask(
+                    "max attempts", default=default.max_attempts
+                ),
+                statuses=[int(code) for code in statuses.split(",")],
+                retry_errors=Confirm.ask("retry on connection errors", default=True),
+                backoff_base=FloatPrompt.ask(
+                    "backoff base (seconds)", default=default.backoff_base
+                ),
+                backoff_max=FloatPrompt.ask(
+                    "backoff max (seconds)", default=default.backoff_max
+                ),
+            )
+
+        api_call_crud.update(
+            self.session,
+            db_obj=self.selected_api_call,
+            obj_in=APICallUpdate(retry_policy=retry_policy),
+        )
+
+    def _set_retention_policy(self) -> None:
+        if not Confirm.ask("prune old responses?"):
+            retention_policy = None
+        else:
+            keep_last = Prompt.ask("keep last n responses", default="")
+            keep_days = Prompt.ask("keep responses for days", default="")
+            retention_policy = RetentionPolicy(
+                keep_last=int(keep_last) if keep_last else None,
+                keep_days=float(keep_days) if keep_days else None,
+                downsample_hourly=Confirm.ask(
+                    "keep one response per hour beyond that", default=False
+                ),
+                keep_errors=Confirm.ask("always keep non-2xx responses", default=True),
+            )
+
+        api_call_crud.update(
+            self.session,
+            db_obj=self.selected_api_call,
+            obj_in=APICallUpdate(retention_policy=retention_policy),
+        )
+
+    def _list_responses(self) -> None:
         print()
-        for response in responses:
-            self.console.print(response)
+        before = None
+        while True:
+            responses = response_crud.get_by_api_call(
+                self.session,
+                api_call=self.selected_api_call,
+                before=before,
+                limit=settings.page_size,
+            )
+            for response in responses:
+                self.console.print(response)
+
+            if len(responses) < settings.page_size or not Confirm.ask("show more?"):
+                break
+            before = (responses[-1].timestamp, responses[-1].id)
 
         print()
 
     def _call_api(self) -> None:
         try:
-            validated_call = APICallReady.from_orm(self.selected_api_call)
+            prepared = prepare(self.session, self.selected_api_call)
         except ValidationError as e:
             self.err_console.print("api call not ready to send")
             for err in e.errors():
@@ -260,47 +353,27 @@ class APICallMenu(AppMenu):
 
             return
 
-        headers = {h.key: h.value for h in self.selected_api_call.headers}
-        params = {p.key: p.value for p in self.selected_api_call.parameters}
-
-        for g_header in header_crud.get_globals(self.session):
-            headers[g_header.key] = g_header.value
-
         try:
-            res = httpx.request(
-                validated_call.method.value,
-                validated_call.url,
-                headers=headers,
-                params=params,
-                content=validated_call.content,
-            )
+            sent = send(get_client(), prepared)
         except httpx.RequestError:
             self.err_console.print("request error")
             return
 
         self.console.print()
-        self.console.print("[bold blue]STATUS CODE:", res.status_code)
+        self.console.print("[bold blue]STATUS CODE:", sent.status_code)
+        if sent.cache_status != CacheStatus.MISS:
+            self.console.print("[bold blue]CACHE:", sent.cache_status.value)
+        if sent.timings.total_ms is not None:
+            self.console.print("[bold blue]TIMINGS:", str(sent.timings))
         self.console.print()
-        self.console.print_json(res.content.decode())
+        if sent.body.content is not None:
+            self.console.print_json(sent.body.content.decode())
+        elif sent.body.blob_key is not None:
+            blob_path = blob_store.path(sent.body.blob_key)
+            self.console.print(f"{sent.body.size} bytes stored in {blob_path}")
         self.console.print()
 
-        resp_db = response_crud.create(
-            self.session,
-            obj_in=ResponseCreate(
-                timestamp=datetime.now(timezone.utc),
-                url=validated_call.url,
-                code=res.status_code,
-                method=validated_call.method,
-                content=res.content,
-                api_call_id=validated_call.id,
-            ),
-        )
-
-        resp_data = ResponseData(
-            req_headers=headers, req_parameters=params, res_headers=dict(res.headers)
-        )
-        resp_db.data = resp_data.dict()
-        self.session.commit()
+        save_response(self.session, prepared, sent)
 
     def _set_url(self) -> None:
         scheme = Prompt.ask("scheme", default="http")
@@ -427,17 +500,20 @@ class JsonValueType(StrEnumLower):
     # TODO: float
 
 
-def init(debug: bool = False) -> None:
-    engine = create_engine("sqlite:///api_call.db", echo=debug)
-    Base.metadata.create_all(engine)
+def init(debug: bool = False, http2: bool = False) -> None:
+    if http2:
+        settings.http2 = True
 
-    with Session(engine) as session:
+    with get_session(echo=debug) as session:
         api_app = MainMenu(
             session=session,
             console=Console(),
             err_console=Console(stderr=True, style="bold red"),
         )
-        api_app.run()
+        try:
+            api_app.run()
+        finally:
+            close_client()
 
 
 if __name__ == "__main__":
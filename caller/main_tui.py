@@ -1,22 +1,35 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from functools import partial
 
 import httpx
-from sqlalchemy import create_engine
+from pydantic import ValidationError
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 from textual import on
 from textual.app import App
 from textual.binding import Binding
 from textual.containers import Container
+from textual.reactive import reactive
 from textual.widgets import Label
 
-from caller.crud import api_call_crud, header_crud, response_crud
-from caller.db import Base
-from caller.schemas.api_calls import APICallReady
-from caller.schemas.responses import ResponseCreate
+from caller import retention, search
+from caller.cache import CacheStatus
+from caller.client import aclose_async_client, get_async_client
+from caller.config import settings
+from caller.crud import api_call_crud, body_crud, response_crud, rollup_crud
+from caller.db import APICall
+from caller.db_thread import SessionThread
+from caller.engine import get_engine, get_session
+from caller.enums import Period
+from caller.schemas.api_calls import APICallCreate
+from caller.sender import PreparedCall, async_send, prepare, save_response
+from caller.stats import Stats
 from caller.tui.screens import APICallListScreen
-from caller.tui.widgets import APICallListItem, ListViewVim
+from caller.tui.widgets import APICallListItem, APICallView, ListViewVim
 
 
 class MainApp(App):
@@ -26,40 +39,122 @@ class MainApp(App):
 
     CSS_PATH = "style/style.css"
 
+    in_flight = reactive(0)
+
     def __init__(self, session: Session, watch_css: bool = False):
+        """
+        `session` should not expire on commit, its objects are read by
+        the ui while the session itself lives on a database thread
+        """
         super().__init__(watch_css=watch_css)
         self.session = session
+        self.db = SessionThread(session)
 
-    def on_mount(self) -> None:
-        api_calls = api_call_crud.get_multi(self.session)
+    async def on_mount(self) -> None:
+        api_calls = await self.db.run(api_call_crud.get_page, limit=settings.page_size)
         self.push_screen(APICallListScreen(api_calls))
+        self.set_interval(settings.prune_interval, self.prune_responses)
+
+    def prune_responses(self) -> None:
+        # a plain function runs in a thread, so it gets a session of its own
+        self.run_worker(
+            self._prune,
+            name="prune",
+            group="prune",
+            exclusive=True,
+            exit_on_error=False,
+        )
+
+    def _prune(self) -> None:
+        with get_session() as session:
+            retention.prune(session)
+            body_crud.sweep_blobs(session)
+        retention.incremental_vacuum(get_engine())
 
     def action_quit(self) -> None:
         self.exit()
 
+    # database work runs in workers so a slow commit never holds up input
+
     @on(APICallListScreen.Create)
     def create_api_call(self, event: APICallListScreen.Create) -> None:
-        db_api_call = api_call_crud.create(self.session, obj_in=event.api_call)
-        self.query_one("#api-calls", ListViewVim).append(APICallListItem(db_api_call))
+        self.run_worker(self._create_api_call(event.api_call), group="db")
+
+    async def _create_api_call(self, api_call: APICallCreate) -> None:
+        db_api_call = await self.db.run(api_call_crud.create, obj_in=api_call)
         api_call_list = self.query_one("#api-calls", ListViewVim)
+        api_call_list.append(APICallListItem(db_api_call))
         if api_call_list.index is None:
             return
 
         # highlight now api call
         api_call_list.index = len(api_call_list._nodes) - 1
 
+    @on(APICallListScreen.LoadMore)
+    def load_more_api_calls(self, event: APICallListScreen.LoadMore) -> None:
+        self.run_worker(self._load_more_api_calls(event), group="db")
+
+    async def _load_more_api_calls(self, event: APICallListScreen.LoadMore) -> None:
+        api_calls = await self.db.run(
+            api_call_crud.get_page, after=event.after, limit=settings.page_size
+        )
+        api_call_list = self.query_one("#api-calls", ListViewVim)
+        for api_call in api_calls:
+            # calls created in this session are already at the bottom
+            if not api_call_list.query(f"#api-call-list-item-{api_call.id}"):
+                api_call_list.append(APICallListItem(api_call))
+        event.screen.page_loaded(api_calls)
+
+    @on(APICallListScreen.ShowResponse)
+    def show_response(self, event: APICallListScreen.ShowResponse) -> None:
+        # only the call highlighted last is worth showing. a partial, not a
+        # coroutine, so workers cancelled before they start leave no warning
+        self.run_worker(
+            partial(self._show_response, event.api_call.id),  # type: ignore[arg-type]
+            group="show-response",
+            exclusive=True,
+        )
+
+    async def _show_response(self, api_call_id: int) -> None:
+        text = await self.db.run(_latest_response_text, api_call_id)
+        self.query_one("#response-content", Label).update(text)
+        await self._show_stats(api_call_id)
+
+    async def _show_stats(self, api_call_id: int) -> None:
+        text = await self.db.run(_stats_text, api_call_id)
+        # the highlight may have moved on while the rollups were read
+        if self.query_one(APICallView).api_call.id == api_call_id:
+            self.query_one("#api-call-stats", Label).update(text)
+
+    @on(APICallListScreen.Search)
+    def search(self, event: APICallListScreen.Search) -> None:
+        self.run_worker(
+            partial(self._search, event.query),  # type: ignore[arg-type]
+            group="search",
+            exclusive=True,
+        )
+
+    async def _search(self, query: str) -> None:
+        text = await self.db.run(_search_text, query)
+        self.query_one("#response-content", Label).update(text)
+
     @on(APICallListScreen.Delete)
     def delete_api_call(self, event: APICallListScreen.Delete) -> None:
-        api_call_crud.remove(self.session, obj=event.api_call)
         self.app.query_one(
             f"#api-call-list-item-{event.api_call.id}", APICallListItem
         ).remove()
+        self.run_worker(
+            self.db.run(api_call_crud.remove, obj=event.api_call), group="db"
+        )
 
     @on(APICallListScreen.Update)
     def update_api_call(self, event: APICallListScreen.Update) -> None:
+        self.run_worker(self._update_api_call(event), group="db")
+
+    async def _update_api_call(self, event: APICallListScreen.Update) -> None:
         print("UPDATING:", event.obj_in)
-        api_call = api_call_crud.update(
-            self.session, db_obj=event.db_obj, obj_in=event.obj_in
+        api_call = await self.db.run(
+            api_call_crud.update, db_obj=event.db_obj, obj_in=event.obj_in
         )
         event.container.api_call = api_call
         event.container.update_values()
@@ -75,48 +170,119 @@ class MainApp(App):
 
     @on(APICallListScreen.CallAPI)
     def call_api(self, event: APICallListScreen.CallAPI) -> None:
-        headers = {h.key: h.value for h in event.api_call.headers}
-        params = {p.key: p.value for p in event.api_call.parameters}
-
-        for g_header in header_crud.get_globals(self.session):
-            headers[g_header.key] = g_header.value
-
-        validated_call = APICallReady.from_orm(event.api_call)
+        self.run_worker(self._call_api(event.api_call), group="db")
 
+    async def _call_api(self, api_call: APICall) -> None:
         try:
-            res = httpx.request(
-                validated_call.method.value,
-                validated_call.url,
-                headers=headers,
-                params=params,
-                content=validated_call.content,
-            )
-        except httpx.HTTPError as e:
+            prepared = await self.db.run(prepare, api_call)
+        except ValidationError as e:
             self.query_one("#response-content", Label).update(str(e))
             return
 
-        resp_db = response_crud.create(
-            self.session,
-            obj_in=ResponseCreate(
-                timestamp=datetime.now(timezone.utc),
-                url=validated_call.url,
-                code=res.status_code,
-                method=validated_call.method,
-                content=res.content,
-                api_call_id=validated_call.id,
-            ),
+        validated_call = prepared.api_call
+        # sends run as async workers so slow endpoints never block the ui
+        self.run_worker(
+            self._send(prepared),
+            name=validated_call.name,
+            group=f"api-call-{validated_call.id}",
+            description=f"{validated_call.method.value} {validated_call.url}",
+            exit_on_error=False,
         )
 
+    @on(APICallListScreen.CancelCall)
+    def cancel_api_call(self, event: APICallListScreen.CancelCall) -> None:
+        self.workers.cancel_group(self, f"api-call-{event.api_call.id}")
+
+    def watch_in_flight(self, in_flight: int) -> None:
+        text = f"{in_flight} request(s) in flight" if in_flight > 0 else ""
+        self.query_one("#in-flight", Label).update(text)
+
+    async def _send(self, prepared: PreparedCall) -> None:
+        validated_call = prepared.api_call
+        response_label = self.query_one("#response-content", Label)
+
+        self.in_flight += 1
         try:
-            content = res.json()
-        except Exception:
-            content = res.content
+            sent = await async_send(get_async_client(), prepared)
+        except httpx.HTTPError as e:
+            response_label.update(f"{validated_call.name}: {e!r}")
+            return
+        except asyncio.CancelledError:
+            response_label.update(f"{validated_call.name}: cancelled")
+            raise
+        finally:
+            self.in_flight -= 1
+
+        resp_db = await self.db.run(save_response, prepared, sent)
+        await self._show_stats(validated_call.id)
+
+        content: object
+        if sent.body.content is None:
+            content = f"<{sent.body.size} bytes stored in {sent.body.blob_key}>"
+        else:
+            try:
+                content = json.loads(sent.body.content)
+            except ValueError:
+                content = sent.body.content
 
         # TODO: Static reactive response widget
-        self.query_one("#response-content", Label).update(
-            f"STATUS CODE: {resp_db.code}\n{str(content)}"
+        cache = (
+            f" ({sent.cache_status.value})"
+            if sent.cache_status != CacheStatus.MISS
+            else ""
+        )
+        response_label.update(
+            f"{validated_call.name}\nSTATUS CODE: {resp_db.code}{cache}\n"
+            f"{sent.timings}\n{str(content)}"
         )
 
+    async def on_unmount(self) -> None:
+        await aclose_async_client()
+        self.db.close()
+
+
+def _latest_response_text(session: Session, api_call_id: int) -> str:
+    latest = response_crud.get_latest(session, api_call_id=api_call_id)
+    if latest is None:
+        return ""
+
+    body = latest.body
+    content = bytes(body[: settings.inline_threshold]) if body else body
+    return (
+        f"{latest.timestamp}\nSTATUS CODE: {latest.code}\n"
+        f"{latest.timings}\n{str(content)}"
+    )
+
+
+def _stats_text(session: Session, api_call_id: int) -> str:
+    now = datetime.now(timezone.utc)
+    lines = []
+    for title, period, since in (
+        ("24h", Period.HOUR, now - timedelta(hours=23)),
+        ("7d", Period.DAY, now - timedelta(days=6)),
+    ):
+        rollups = rollup_crud.get_since(
+            session, api_call_id=api_call_id, period=period, since=since
+        )
+        lines.append(f"{title}: {Stats.from_rollups(rollups)}")
+    return "\n".join(lines)
+
+
+def _search_text(session: Session, query: str) -> str:
+    try:
+        api_calls = search.search_api_calls(session, query)
+        responses = search.search_responses(session, query, limit=settings.page_size)
+    except OperationalError as e:
+        return f"invalid query: {e.orig}"
+
+    lines = [f"api call {hit.id} {hit.name}: {hit.snippet}" for hit in api_calls]
+    lines += [
+        f"response {hit.id} (api call {hit.api_call_id}) {hit.timestamp} "
+        f"{hit.code}: {hit.snippet}"
+        for hit in responses
+    ]
+    return "\n".join(lines) or f"no matches for {query!r}"
+
 
 def run_tui_app(session: Session) -> None:
     app = MainApp(session, watch_css=True)
@@ -124,8 +290,5 @@ def run_tui_app(session: Session) -> None:
 
 
 if __name__ == "__main__":
-    engine = create_engine("sqlite:///api_call.db")
-    Base.metadata.create_all(engine)
-
-    with Session(engine) as session:
+    with get_session(expire_on_commit=False) as session:
         run_tui_app(session)
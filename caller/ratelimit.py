@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+from caller.config import RateLimit, settings
+
+
+class TokenBucket:
+    """
+    Allows `rate` sends per second on average and bursts of up to `burst`.
+    Callers reserve a token up front and wait until it is due, so the same
+    bucket works for both threads and coroutines
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.tokens + (now - self.updated) * self.rate, self.burst
+            )
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self) -> None:
+        if (delay := self._reserve()) > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        if (delay := self._reserve()) > 0:
+            await asyncio.sleep(delay)
+
+
+_buckets: dict[str, Optional[TokenBucket]] = {}
+_buckets_lock = threading.Lock()
+
+
+def _limit_for(url: httpx.URL) -> Optional[RateLimit]:
+    for key in (url.netloc.decode(), url.host):
+        if key in settings.rate_limits:
+            return settings.rate_limits[key]
+    return settings.rate_limit
+
+
+def limiter_for(url: str) -> Optional[TokenBucket]:
+    """
+    The shared bucket of the host of `url`, None if it is not rate limited
+    """
+    parsed = httpx.URL(url)
+    host = parsed.netloc.decode()
+    with _buckets_lock:
+        if host not in _buckets:
+            limit = _limit_for(parsed)
+            _buckets[host] = (
+                TokenBucket(limit.rate, limit.burst) if limit is not None else None
+            )
+        return _buckets[host]
@@ -0,0 +1,102 @@
+import threading
+from enum import auto
+from time import monotonic
+from typing import Optional
+
+import httpx
+
+from caller.config import settings
+from caller.enums import StrEnumLower
+
+
+class CircuitOpenError(httpx.RequestError):
+    """
+    Raised instead of sending when the circuit of a host is open
+    """
+
+
+class CircuitState(StrEnumLower):
+    CLOSED = auto()
+    OPEN = auto()
+    HALF_OPEN = auto()
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects sends for
+    `reset_timeout` seconds. After that a single trial send is let through;
+    success closes the circuit and failure opens it again
+    """
+
+    def __init__(self, host: str, threshold: int, reset_timeout: float) -> None:
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        if self.threshold <= 0:
+            return
+
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return
+            if (
+                self.state == CircuitState.OPEN
+                and monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = CircuitState.HALF_OPEN
+                return
+
+        raise CircuitOpenError(f"circuit open for {self.host}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+
+    def abandon_trial(self) -> None:
+        """
+        A send that ended without an answer from the host (cancelled, or a
+        local error) says nothing about its health. Only a pending trial
+        has to be given back, so the circuit reopens instead of staying
+        half open
+        """
+        with self._lock:
+            if self.state == CircuitState.HALF_OPEN:
+                self.state = CircuitState.OPEN
+                self.opened_at = monotonic()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitState.HALF_OPEN or (
+                self.threshold > 0 and self.failures >= self.threshold
+            ):
+                self.state = CircuitState.OPEN
+                self.opened_at = monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    host = httpx.URL(url).netloc.decode()
+    with _breakers_lock:
+        if (breaker := _breakers.get(host)) is None:
+            breaker = CircuitBreaker(
+                host, settings.breaker_threshold, settings.breaker_reset_timeout
+            )
+            _breakers[host] = breaker
+        return breaker
+
+
+def is_failure(status: Optional[int]) -> bool:
+    """
+    Transport errors and server errors count against the circuit
+    """
+    return status is None or status >= 500
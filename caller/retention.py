@@ -0,0 +1,51 @@
+from typing import Optional
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from caller.config import settings
+from caller.crud import api_call_crud, response_crud
+from caller.db import APICall
+from caller.schemas.retention import RetentionPolicy
+
+
+def policy_for(api_call: APICall) -> Optional[RetentionPolicy]:
+    if api_call.retention_policy is not None:
+        return RetentionPolicy.parse_obj(api_call.retention_policy)
+    return settings.retention
+
+
+def prune(session: Session, *, batch_size: int = 500) -> int:
+    """
+    Apply the retention policy of every api call, one batch of deletes
+    at a time. Returns the number of responses deleted
+    """
+    pruned = 0
+    after = None
+    while api_calls := api_call_crud.get_page(
+        session, after=after, limit=settings.page_size
+    ):
+        # pruning commits and expires the page so read what is needed first
+        policies = [(api_call.id, policy_for(api_call)) for api_call in api_calls]
+        for api_call_id, policy in policies:
+            if policy is None:
+                continue
+            pruned += response_crud.prune(
+                session, api_call_id=api_call_id, policy=policy, batch_size=batch_size
+            )
+        after = policies[-1][0]
+    return pruned
+
+
+def incremental_vacuum(engine: Engine) -> None:
+    """
+    Hand the pages freed by pruning back to the file system. Does nothing
+    on databases created before auto_vacuum was enabled until they have
+    been VACUUMed once
+    """
+    with engine.connect() as conn:
+        # the pragma frees one page per step and only executescript steps
+        # it to completion
+        conn.connection.dbapi_connection.executescript(  # type: ignore
+            "PRAGMA incremental_vacuum"
+        )
@@ -0,0 +1,110 @@
+import asyncio
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Optional
+
+import httpx
+from pydantic import ValidationError
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy.orm import Session
+
+from caller.client import aclose_async_client, get_async_client
+from caller.db import APICall
+from caller.sender import (
+    PreparedCall,
+    SentResponse,
+    async_send,
+    prepare,
+    save_responses,
+)
+from caller.writer import ResponseWriter
+
+
+@dataclass
+class RunResult:
+    api_call: APICall
+    code: Optional[int] = None
+    elapsed: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.code is not None and self.code < 400
+
+
+async def run_collection(
+    session: Session,
+    api_calls: list[APICall],
+    *,
+    concurrency: int,
+    writer: Optional[ResponseWriter] = None,
+) -> list[RunResult]:
+    """
+    Send every api call with at most `concurrency` requests in flight
+    and save the responses of those that complete, through `writer` as
+    they arrive or all at once at the end without one
+    """
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    sent_calls: list[tuple[PreparedCall, SentResponse]] = []
+
+    async def run_one(api_call: APICall) -> RunResult:
+        result = RunResult(api_call)
+        try:
+            prepared = prepare(session, api_call)
+        except ValidationError:
+            result.error = "not ready to send"
+            return result
+
+        async with semaphore:
+            sent_at = perf_counter()
+            try:
+                sent = await async_send(client, prepared)
+            except httpx.HTTPError as e:
+                result.error = repr(e)
+                return result
+            result.elapsed = perf_counter() - sent_at
+
+        if writer is not None:
+            await writer.submit_async(prepared, sent)
+        else:
+            sent_calls.append((prepared, sent))
+        result.code = sent.status_code
+        return result
+
+    try:
+        results = await asyncio.gather(*(run_one(call) for call in api_calls))
+    finally:
+        await aclose_async_client()
+        # one transaction for the whole run instead of a commit per response
+        save_responses(session, sent_calls)
+
+    return list(results)
+
+
+def print_run_results(console: Console, results: list[RunResult]) -> None:
+    table = Table(title="collection run")
+    table.add_column("id", justify="right")
+    table.add_column("name")
+    table.add_column("method")
+    table.add_column("url")
+    table.add_column("code", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("error")
+
+    for result in results:
+        style = "green" if result.ok else "red"
+        table.add_row(
+            str(result.api_call.id),
+            result.api_call.name,
+            result.api_call.method.value,
+            result.api_call.url,
+            f"[{style}]{result.code or '-'}",
+            f"{result.elapsed * 1000:.1f}" if result.elapsed is not None else "-",
+            result.error or "",
+        )
+
+    console.print(table)
+    failed = sum(not result.ok for result in results)
+    console.print(f"{len(results) - failed} passed, {failed} failed")
@@ -1,8 +1,11 @@
+import json
 from typing import Annotated, Optional
 
-from pydantic import AnyHttpUrl, BaseModel, Field
+from pydantic import AnyHttpUrl, BaseModel, Field, validator
 
 from caller.enums import Method
+from caller.schemas.retention import RetentionPolicy
+from caller.schemas.retry import RetryPolicy
 
 
 class APICallBase(BaseModel):
@@ -10,13 +13,37 @@ class APICallBase(BaseModel):
     url: Annotated[Optional[str], AnyHttpUrl] = None
     method: Annotated[Optional[Method], Field()] = None
     content: Optional[str] = None
+    timeout: Optional[float] = None
+    tags: Optional[list[str]] = None
+    use_cache: Optional[bool] = None
+    retry_policy: Optional[RetryPolicy] = None
+    retention_policy: Optional[RetentionPolicy] = None
+    import_key: Optional[str] = None
+    import_hash: Optional[str] = None
     # headers: Optional[dict] = Field(default=None)
 
+    @validator("tags", pre=True)
+    def split_tags(cls, value: object) -> object:
+        if isinstance(value, str):
+            return [tag.strip() for tag in value.split(",") if tag.strip()]
+        return value
+
+    @validator("retry_policy", "retention_policy", pre=True)
+    def parse_policy(cls, value: object) -> object:
+        if isinstance(value, str):
+            return json.loads(value) if value.strip() else None
+        return value
+
 
 class APICallCreate(APICallBase):
     name: str
 
 
+class APICallImport(APICallCreate):
+    # only used when ids are kept on import, otherwise they are assigned
+    id: int
+
+
 class APICallUpdate(APICallBase):
     ...
 
@@ -0,0 +1,31 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+from caller.codecs import Codec
+
+
+class BodyBase(BaseModel):
+    hash: Optional[str]
+    content: Optional[bytes]
+    codec: Optional[Codec]
+    blob: Optional[bool]
+    size: Optional[int]
+    ref_count: Optional[int]
+
+
+class BodyCreate(BodyBase):
+    hash: str
+    blob: bool
+    size: int
+
+
+class BodyUpdate(BodyBase):
+    ...
+
+
+class BodyGet(BodyBase):
+    id: int
+
+    class Config:
+        orm_mode = True
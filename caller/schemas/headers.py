@@ -23,3 +23,8 @@ class HeaderGet(HeaderBase):
 
     class Config:
         orm_mode = True
+
+
+class GlobalHeaderGet(HeaderGet):
+    key: str
+    value: str
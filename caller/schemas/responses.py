@@ -3,6 +3,7 @@ from typing import Annotated, Optional
 
 from pydantic import AnyUrl, BaseModel, Field
 
+from caller.codecs import Codec
 from caller.enums import Method
 
 
@@ -15,9 +16,23 @@ class ResponseData(BaseModel):
 class ResponseBase(BaseModel):
     code: Optional[int]
     content: Optional[bytes]
+    content_codec: Optional[Codec]
+    blob_key: Optional[str]
+    body_hash: Optional[str]
+    size: Optional[int]
+    truncated: Optional[bool]
     url: Annotated[Optional[str], AnyUrl]
     method: Annotated[Optional[Method], Field()] = None
     api_call_id: Optional[int]
+    data: Optional[dict[str, dict[str, str]]]
+
+    connect_ms: Optional[float]
+    tls_ms: Optional[float]
+    ttfb_ms: Optional[float]
+    download_ms: Optional[float]
+    total_ms: Optional[float]
+    request_bytes: Optional[int]
+    response_bytes: Optional[int]
 
 
 class ResponseCreate(ResponseBase):
@@ -28,6 +43,11 @@ class ResponseCreate(ResponseBase):
     api_call_id: int
 
 
+class ResponseImport(ResponseCreate):
+    # only used when ids are kept on import, otherwise they are assigned
+    id: int
+
+
 class ResponseUpdate(ResponseBase):
     ...
 
@@ -0,0 +1,17 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class RetentionPolicy(BaseModel):
+    """
+    A response is kept if it is one of the newest `keep_last`, younger
+    than `keep_days`, not a 2xx (with `keep_errors`) or, with
+    `downsample_hourly`, the newest response of its hour. Everything else
+    is pruned
+    """
+
+    keep_last: Optional[int] = Field(default=None, ge=0)
+    keep_days: Optional[float] = Field(default=None, ge=0)
+    downsample_hourly: bool = False
+    keep_errors: bool = True
@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class RetryPolicy(BaseModel):
+    max_attempts: int = Field(default=3, ge=1)
+    statuses: list[int] = [429, 502, 503, 504]
+    retry_errors: bool = True
+    backoff_base: float = Field(default=0.5, ge=0)
+    backoff_max: float = Field(default=30.0, ge=0)
+    jitter: bool = True
+    respect_retry_after: bool = True
+
+    def should_retry(self, attempt: int, status: Optional[int] = None) -> bool:
+        """
+        `status` is None when the attempt failed with a transport error
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if status is None:
+            return self.retry_errors
+        return status in self.statuses
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if self.respect_retry_after and retry_after is not None:
+            if (seconds := _parse_retry_after(retry_after)) is not None:
+                return min(seconds, self.backoff_max)
+
+        delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+        # full jitter so clients retrying together spread out
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
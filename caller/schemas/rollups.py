@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from caller.enums import Period
+
+
+class RollupBase(BaseModel):
+    api_call_id: Optional[int]
+    period: Optional[Period]
+    start: Optional[datetime]
+    count: Optional[int]
+    errors: Optional[int]
+    timed: Optional[int]
+    min_ms: Optional[float]
+    max_ms: Optional[float]
+    sum_ms: Optional[float]
+    sketch: Optional[dict[str, int]]
+
+
+class RollupCreate(RollupBase):
+    api_call_id: int
+    period: Period
+    start: datetime
+    count: int
+    errors: int
+    timed: int
+    sum_ms: float
+    sketch: dict[str, int]
+
+
+class RollupUpdate(RollupBase):
+    ...
+
+
+class RollupGet(RollupBase):
+    id: int
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,265 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import (
+    ColumnElement,
+    column,
+    func,
+    literal_column,
+    select,
+    table,
+    text,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.sql.expression import TableClause
+
+from caller.blobs import Buffer
+from caller.config import settings
+from caller.db import APICall, Body, Response
+from caller.schemas.responses import ResponseCreate
+
+HIGHLIGHT = ("«", "»")
+
+# created by caller.db.init_db, not mapped since fts5 tables are virtual
+bodies_fts = table("bodies_fts", column("rowid"), column("rank"), column("body"))
+response_headers_fts = table(
+    "response_headers_fts", column("rowid"), column("rank"), column("headers")
+)
+api_calls_fts = table(
+    "api_calls_fts",
+    column("rowid"),
+    column("rank"),
+    column("name"),
+    column("url"),
+    column("content"),
+)
+
+_INSERT_BODY = text("INSERT INTO bodies_fts(rowid, body) VALUES (:id, :body)")
+_INSERT_HEADERS = text(
+    "INSERT INTO response_headers_fts(rowid, headers) VALUES (:id, :headers)"
+)
+
+
+@dataclass
+class ResponseHit:
+    id: int
+    api_call_id: int
+    timestamp: datetime
+    code: int
+    rank: float
+    snippet: str
+
+    @property
+    def cursor(self) -> tuple[float, int]:
+        return self.rank, self.id
+
+
+@dataclass
+class APICallHit:
+    id: int
+    name: str
+    url: Optional[str]
+    snippet: str
+
+
+def body_text(body: Optional[Buffer]) -> str:
+    if not body:
+        return ""
+    return bytes(body[: settings.search_body_limit]).decode(errors="ignore")
+
+
+def headers_text(data: Optional[dict[str, Any]]) -> str:
+    res_headers = {k.lower(): v for k, v in (data or {}).get("res_headers", {}).items()}
+    return "\n".join(
+        f"{key}: {res_headers[key]}"
+        for key in settings.search_headers
+        if key in res_headers
+    )
+
+
+def index_body(session: Session, body_id: int, body: Optional[Buffer]) -> None:
+    """
+    Add a newly stored body to the search index. Bodies are deduplicated
+    so this happens once per distinct body, not once per response
+    """
+    session.execute(_INSERT_BODY, {"id": body_id, "body": body_text(body)})
+
+
+def unindex_bodies(session: Session, ids: Sequence[int]) -> None:
+    stmt = text("DELETE FROM bodies_fts WHERE rowid = :id")
+    if ids:
+        session.execute(stmt, [{"id": id} for id in ids])
+
+
+def index_responses(
+    session: Session, responses: Sequence[tuple[int, ResponseCreate]]
+) -> None:
+    """
+    Add the headers of newly created responses to the search index, their
+    bodies are indexed by body_crud when stored
+    """
+    rows = [
+        {"id": response_id, "headers": headers}
+        for response_id, obj_in in responses
+        if (headers := headers_text(obj_in.data))
+    ]
+    if rows:
+        session.execute(_INSERT_HEADERS, rows)
+
+
+def unindex_responses(session: Session, ids: Sequence[int]) -> None:
+    stmt = text("DELETE FROM response_headers_fts WHERE rowid = :id")
+    if ids:
+        session.execute(stmt, [{"id": id} for id in ids])
+
+
+def reindex(session: Session, *, batch_size: int = 500) -> tuple[int, int]:
+    """
+    Rebuild every index from scratch, committing once per batch. Returns
+    the number of bodies and responses indexed
+    """
+    session.execute(text("INSERT INTO api_calls_fts(api_calls_fts) VALUES ('rebuild')"))
+    session.execute(text("DELETE FROM bodies_fts"))
+    session.execute(text("DELETE FROM response_headers_fts"))
+    session.commit()
+
+    bodies = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(Body)
+            .where(Body.id > last_id)
+            .options(undefer(Body.content))
+            .order_by(Body.id)
+            .limit(batch_size)
+        )
+        body_batch = list(session.execute(stmt).scalars())
+        if not body_batch:
+            break
+
+        last_id = body_batch[-1].id
+        session.execute(
+            _INSERT_BODY,
+            [{"id": body.id, "body": body_text(body.read())} for body in body_batch],
+        )
+        bodies += len(body_batch)
+        session.commit()
+        session.expunge_all()
+
+    responses = 0
+    last_id = 0
+    while True:
+        response_stmt = (
+            select(Response.id, Response.data)
+            .where(Response.id > last_id)
+            .order_by(Response.id)
+            .limit(batch_size)
+        )
+        batch = session.execute(response_stmt).all()
+        if not batch:
+            return bodies, responses
+
+        last_id = batch[-1].id
+        rows = [
+            {"id": id, "headers": headers}
+            for id, data in batch
+            if (headers := headers_text(data))
+        ]
+        if rows:
+            session.execute(_INSERT_HEADERS, rows)
+        responses += len(batch)
+        session.commit()
+
+
+def match_query(query: str, *, raw: bool = False) -> str:
+    """
+    Turn free text into an FTS5 query matching every word. With `raw` the
+    query is passed through as FTS5 syntax (OR, NEAR, prefix*, column:)
+    """
+    if raw:
+        return query
+    words = query.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def search_responses(
+    session: Session,
+    query: str,
+    *,
+    after: Optional[tuple[float, int]] = None,
+    limit: int = 20,
+    raw: bool = False,
+) -> list[ResponseHit]:
+    """
+    Responses whose body or selected headers match `query`, best first.
+    Pass the cursor of the last hit of a page as `after` for the next one
+    """
+    body_hits = (
+        select(
+            Response.id,
+            bodies_fts.c.rank,
+            _snippet(bodies_fts).label("snippet"),
+        )
+        .join_from(bodies_fts, Body, Body.id == bodies_fts.c.rowid)
+        .join(Response, Response.body_hash == Body.hash)
+        .where(_match(bodies_fts, query, raw=raw))
+    )
+    header_hits = (
+        select(
+            Response.id,
+            response_headers_fts.c.rank,
+            _snippet(response_headers_fts).label("snippet"),
+        )
+        .join_from(
+            response_headers_fts, Response, Response.id == response_headers_fts.c.rowid
+        )
+        .where(_match(response_headers_fts, query, raw=raw))
+    )
+    hits = union_all(body_hits, header_hits).subquery()
+    # a response matching both its body and headers counts once, with the
+    # better rank. sqlite takes bare columns from the row min() picked
+    best = (
+        select(hits.c.id, func.min(hits.c.rank).label("rank"), hits.c.snippet)
+        .group_by(hits.c.id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            Response.id,
+            Response.api_call_id,
+            Response.timestamp,
+            Response.code,
+            best.c.rank,
+            best.c.snippet,
+        )
+        .join_from(best, Response, Response.id == best.c.id)
+        .order_by(best.c.rank, best.c.id)
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(best.c.rank, best.c.id) > after)
+    return [ResponseHit(*row) for row in session.execute(stmt)]
+
+
+def search_api_calls(
+    session: Session, query: str, *, limit: int = 20, raw: bool = False
+) -> list[APICallHit]:
+    stmt = (
+        select(APICall.id, APICall.name, APICall.url, _snippet(api_calls_fts))
+        .join_from(api_calls_fts, APICall, APICall.id == api_calls_fts.c.rowid)
+        .where(_match(api_calls_fts, query, raw=raw))
+        .order_by(api_calls_fts.c.rank)
+        .limit(limit)
+    )
+    return [APICallHit(*row) for row in session.execute(stmt)]
+
+
+def _match(fts: TableClause, query: str, *, raw: bool) -> ColumnElement[bool]:
+    return literal_column(fts.name).bool_op("MATCH")(match_query(query, raw=raw))
+
+
+def _snippet(fts: TableClause) -> ColumnElement[str]:
+    return func.snippet(literal_column(fts.name), -1, *HIGHLIGHT, "…", 12)
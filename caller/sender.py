@@ -0,0 +1,323 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Optional, Sequence
+
+import httpx
+from sqlalchemy.orm import Session
+
+from caller.blobs import BodyCapture, CapturedBody
+from caller.cache import CachedResponse, CacheStatus, lookup
+from caller.config import settings
+from caller.crud.headers import header_crud
+from caller.crud.responses import response_crud
+from caller.db import APICall, Response
+from caller.ratelimit import limiter_for
+from caller.resilience import CircuitBreaker, breaker_for, is_failure
+from caller.schemas.api_calls import APICallReady
+from caller.schemas.responses import ResponseCreate, ResponseData
+from caller.schemas.retry import RetryPolicy
+from caller.timing import RequestTimer, Timings
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+@dataclass
+class PreparedCall:
+    api_call: APICallReady
+    headers: dict[str, str]
+    params: dict[str, str]
+    cached: Optional[CachedResponse] = None
+
+    @property
+    def timeout(self) -> float:
+        return self.api_call.timeout or settings.timeout
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self.api_call.retry_policy or NO_RETRY
+
+    def request_kwargs(self) -> dict[str, Any]:
+        headers = self.headers
+        if self.cached is not None:
+            headers = {**headers, **self.cached.conditional_headers()}
+
+        return {
+            "method": self.api_call.method.value,
+            "url": self.api_call.url,
+            "headers": headers,
+            "params": self.params,
+            "content": self.api_call.content,
+            "timeout": self.timeout,
+        }
+
+
+def prepare(
+    session: Session, api_call: APICall, *, use_cache: bool = True
+) -> PreparedCall:
+    """
+    Validate `api_call` and collect its headers (including global headers)
+    and parameters. Raises `pydantic.ValidationError` if the call is not
+    ready to be sent
+    """
+    validated_call = APICallReady.from_orm(api_call)
+
+    headers = {h.key: h.value for h in api_call.headers}
+    params = {p.key: p.value for p in api_call.parameters}
+
+    for g_header in header_crud.get_globals(session):
+        headers[g_header.key] = g_header.value
+
+    cached = lookup(session, api_call) if use_cache else None
+    return PreparedCall(validated_call, headers, params, cached)
+
+
+@dataclass
+class SentResponse:
+    """
+    A response whose body has already been read into a `CapturedBody`
+    """
+
+    res: httpx.Response
+    body: CapturedBody
+    cache_status: CacheStatus = CacheStatus.MISS
+    timings: Timings = field(default_factory=Timings)
+
+    @property
+    def status_code(self) -> int:
+        return self.res.status_code
+
+    @property
+    def headers(self) -> httpx.Headers:
+        return self.res.headers
+
+
+def _from_cache(
+    cached: CachedResponse, status: CacheStatus, headers: Optional[httpx.Headers] = None
+) -> SentResponse:
+    merged = httpx.Headers(cached.headers)
+    if headers is not None:
+        merged.update(headers)
+    res = httpx.Response(cached.code, headers=merged)
+    return SentResponse(res, cached.body, status)
+
+
+def save_response(
+    session: Session, prepared: PreparedCall, sent: SentResponse
+) -> Response:
+    """
+    Store `sent` as a new response. Fresh cache hits never reached the
+    network so the cached response is returned instead
+    """
+    if sent.cache_status == CacheStatus.FRESH and prepared.cached is not None:
+        cached_response = session.get(Response, prepared.cached.response_id)
+        assert cached_response is not None
+        return cached_response
+
+    return response_crud.create(session, obj_in=response_create(prepared, sent))
+
+
+def save_responses(
+    session: Session, sent_calls: Sequence[tuple[PreparedCall, SentResponse]]
+) -> list[Response]:
+    """
+    Store many sent calls in a single transaction
+    """
+    objs_in = [
+        response_create(prepared, sent)
+        for prepared, sent in sent_calls
+        if sent.cache_status != CacheStatus.FRESH
+    ]
+    return response_crud.create_many(session, objs_in=objs_in)
+
+
+def response_create(prepared: PreparedCall, sent: SentResponse) -> ResponseCreate:
+    validated_call = prepared.api_call
+    resp_data = ResponseData(
+        req_headers=prepared.headers,
+        req_parameters=prepared.params,
+        res_headers=dict(sent.headers),
+    )
+    return ResponseCreate(
+        timestamp=datetime.now(timezone.utc),
+        url=validated_call.url,
+        code=sent.status_code,
+        method=validated_call.method,
+        content=sent.body.content,
+        blob_key=sent.body.blob_key,
+        body_hash=sent.body.hash,
+        size=sent.body.size,
+        truncated=sent.body.truncated,
+        api_call_id=validated_call.id,
+        data=resp_data.dict(),
+        **sent.timings.dict(),
+    )
+
+
+def send(
+    client: httpx.Client,
+    prepared: PreparedCall,
+    *,
+    capture: bool = True,
+    retry: bool = True,
+) -> SentResponse:
+    """
+    Send `prepared` through the circuit breaker and rate limiter of its
+    host, retrying according to its retry policy. Bodies are streamed into a
+    `BodyCapture` so large bodies never have to be held in memory.
+    With `capture=False` the body is drained and only its size is kept
+    """
+    if prepared.cached is not None and prepared.cached.fresh:
+        return _from_cache(prepared.cached, CacheStatus.FRESH)
+
+    policy = prepared.retry_policy if retry else NO_RETRY
+    breaker = breaker_for(prepared.api_call.url)
+    limiter = limiter_for(prepared.api_call.url)
+    attempt = 1
+    while True:
+        breaker.before_request()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            retrying = partial(policy.should_retry, attempt)
+            sent = _send_once(client, prepared, capture, retrying)
+        except httpx.TransportError:
+            breaker.record_failure()
+            if not policy.should_retry(attempt):
+                raise
+            delay = policy.delay(attempt)
+        except BaseException:
+            breaker.abandon_trial()
+            raise
+        else:
+            _record(breaker, sent.status_code)
+            if not policy.should_retry(attempt, sent.status_code):
+                return sent
+            delay = policy.delay(attempt, sent.headers.get("retry-after"))
+
+        time.sleep(delay)
+        attempt += 1
+
+
+async def async_send(
+    client: httpx.AsyncClient,
+    prepared: PreparedCall,
+    *,
+    capture: bool = True,
+    retry: bool = True,
+) -> SentResponse:
+    if prepared.cached is not None and prepared.cached.fresh:
+        return _from_cache(prepared.cached, CacheStatus.FRESH)
+
+    policy = prepared.retry_policy if retry else NO_RETRY
+    breaker = breaker_for(prepared.api_call.url)
+    limiter = limiter_for(prepared.api_call.url)
+    attempt = 1
+    while True:
+        breaker.before_request()
+        if limiter is not None:
+            await limiter.acquire_async()
+        try:
+            retrying = partial(policy.should_retry, attempt)
+            sent = await _async_send_once(client, prepared, capture, retrying)
+        except httpx.TransportError:
+            breaker.record_failure()
+            if not policy.should_retry(attempt):
+                raise
+            delay = policy.delay(attempt)
+        except BaseException:
+            breaker.abandon_trial()
+            raise
+        else:
+            _record(breaker, sent.status_code)
+            if not policy.should_retry(attempt, sent.status_code):
+                return sent
+            delay = policy.delay(attempt, sent.headers.get("retry-after"))
+
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _record(breaker: CircuitBreaker, status: int) -> None:
+    if is_failure(status):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _send_once(
+    client: httpx.Client,
+    prepared: PreparedCall,
+    capture: bool,
+    retrying: Callable[[int], bool],
+) -> SentResponse:
+    timer = RequestTimer()
+    with client.stream(**prepared.request_kwargs(), extensions={"trace": timer}) as res:
+        if res.status_code == 304 and prepared.cached is not None:
+            sent = _from_cache(prepared.cached, CacheStatus.REVALIDATED, res.headers)
+            sent.timings = _finish_timer(timer, res)
+            return sent
+
+        # a response that is retried is thrown away, so its body is never
+        # captured and cannot leave a file in the blob store behind
+        if not capture or retrying(res.status_code):
+            for _ in res.iter_raw():
+                pass
+            body = CapturedBody(size=res.num_bytes_downloaded)
+            return SentResponse(res, body, timings=_finish_timer(timer, res))
+
+        body_capture = BodyCapture()
+        try:
+            for chunk in res.iter_bytes():
+                if not body_capture.write(chunk):
+                    break
+        except BaseException:
+            body_capture.discard()
+            raise
+
+        timings = _finish_timer(timer, res)
+
+    return SentResponse(res, body_capture.finish(), timings=timings)
+
+
+async def _async_send_once(
+    client: httpx.AsyncClient,
+    prepared: PreparedCall,
+    capture: bool,
+    retrying: Callable[[int], bool],
+) -> SentResponse:
+    timer = RequestTimer()
+    kwargs = prepared.request_kwargs()
+    async with client.stream(**kwargs, extensions={"trace": timer.atrace}) as res:
+        if res.status_code == 304 and prepared.cached is not None:
+            sent = _from_cache(prepared.cached, CacheStatus.REVALIDATED, res.headers)
+            sent.timings = _finish_timer(timer, res)
+            return sent
+
+        if not capture or retrying(res.status_code):
+            async for _ in res.aiter_raw():
+                pass
+            body = CapturedBody(size=res.num_bytes_downloaded)
+            return SentResponse(res, body, timings=_finish_timer(timer, res))
+
+        body_capture = BodyCapture()
+        try:
+            async for chunk in res.aiter_bytes():
+                if not body_capture.write(chunk):
+                    break
+        except BaseException:
+            body_capture.discard()
+            raise
+
+        timings = _finish_timer(timer, res)
+
+    return SentResponse(res, body_capture.finish(), timings=timings)
+
+
+def _finish_timer(timer: RequestTimer, res: httpx.Response) -> Timings:
+    return timer.finish(
+        request_bytes=len(res.request.content),
+        response_bytes=res.num_bytes_downloaded,
+    )
@@ -0,0 +1,197 @@
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional, Sequence
+
+from rich.console import Console
+from rich.table import Table
+
+from caller.db import Rollup
+from caller.enums import Period
+
+# quantiles are estimated within 1% of the true latency
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+MIN_MS = 0.001
+
+
+@dataclass
+class LatencySketch:
+    """
+    Histogram of latencies over logarithmically sized bins. Two sketches
+    merge by adding up their bins, so hourly sketches roll up into daily
+    ones (or any range) without keeping individual latencies around
+    """
+
+    bins: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def add(self, ms: float, count: int = 1) -> None:
+        index = math.ceil(math.log(max(ms, MIN_MS), GAMMA))
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "LatencySketch") -> None:
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.bins:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        # middle of the bin, at most ACCURACY off from anything in it
+        return 2 * GAMMA**index / (GAMMA + 1)
+
+    def to_json(self) -> dict[str, int]:
+        return {str(index): count for index, count in self.bins.items()}
+
+    @classmethod
+    def from_json(cls, data: Optional[dict[str, int]]) -> "LatencySketch":
+        return cls({int(index): count for index, count in (data or {}).items()})
+
+
+@dataclass
+class Stats:
+    """
+    Aggregate of any number of responses. `timed` counts the ones that
+    have a total_ms, latencies are over those only
+    """
+
+    count: int = 0
+    errors: int = 0
+    timed: int = 0
+    min_ms: Optional[float] = None
+    max_ms: Optional[float] = None
+    sum_ms: float = 0.0
+    sketch: LatencySketch = field(default_factory=LatencySketch)
+
+    @classmethod
+    def from_rollups(cls, rollups: Iterable[Rollup]) -> "Stats":
+        stats = cls()
+        for rollup in rollups:
+            stats.merge(
+                cls(
+                    count=rollup.count,
+                    errors=rollup.errors,
+                    timed=rollup.timed,
+                    min_ms=rollup.min_ms,
+                    max_ms=rollup.max_ms,
+                    sum_ms=rollup.sum_ms,
+                    sketch=LatencySketch.from_json(rollup.sketch),
+                )
+            )
+        return stats
+
+    def add(self, code: int, total_ms: Optional[float]) -> None:
+        self.count += 1
+        if code >= 400:
+            self.errors += 1
+        if total_ms is None:
+            return
+
+        self.timed += 1
+        self.min_ms = _either(min, self.min_ms, total_ms)
+        self.max_ms = _either(max, self.max_ms, total_ms)
+        self.sum_ms += total_ms
+        self.sketch.add(total_ms)
+
+    def merge(self, other: "Stats") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.timed += other.timed
+        self.min_ms = _either(min, self.min_ms, other.min_ms)
+        self.max_ms = _either(max, self.max_ms, other.max_ms)
+        self.sum_ms += other.sum_ms
+        self.sketch.merge(other.sketch)
+
+    @property
+    def mean_ms(self) -> Optional[float]:
+        return self.sum_ms / self.timed if self.timed else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        estimate = self.sketch.quantile(q)
+        if estimate is None or self.min_ms is None or self.max_ms is None:
+            return None
+        return min(max(estimate, self.min_ms), self.max_ms)
+
+    def __str__(self) -> str:
+        if self.count == 0:
+            return "no responses"
+
+        string = f"{self.count} response(s), {self.errors} error(s)"
+        if self.timed:
+            latencies = [
+                f"{name}={value:.1f}ms"
+                for name, value in (
+                    ("min", self.min_ms),
+                    ("mean", self.mean_ms),
+                    ("p50", self.quantile(0.5)),
+                    ("p95", self.quantile(0.95)),
+                    ("p99", self.quantile(0.99)),
+                    ("max", self.max_ms),
+                )
+                if value is not None
+            ]
+            string += f", {' '.join(latencies)}"
+        return string
+
+
+def print_rollups(console: Console, title: str, rollups: Sequence[Rollup]) -> None:
+    table = Table(title=title)
+    table.add_column("start")
+    table.add_column("count", justify="right")
+    table.add_column("errors", justify="right")
+    for name in ("min", "mean", "p50", "p95", "p99", "max"):
+        table.add_column(f"{name} (ms)", justify="right")
+
+    rows = [
+        (f"{rollup.start:%Y-%m-%d %H:%M}", Stats.from_rollups([rollup]))
+        for rollup in rollups
+    ]
+    rows.append(("total", Stats.from_rollups(rollups)))
+    for start, stats in rows:
+        latencies = (
+            stats.min_ms,
+            stats.mean_ms,
+            stats.quantile(0.5),
+            stats.quantile(0.95),
+            stats.quantile(0.99),
+            stats.max_ms,
+        )
+        table.add_row(
+            start,
+            str(stats.count),
+            str(stats.errors),
+            *("-" if value is None else f"{value:.1f}" for value in latencies),
+        )
+    console.print(table)
+
+
+def period_start(timestamp: datetime, period: Period) -> datetime:
+    """
+    Start of the hour or (UTC) day `timestamp` falls in. Naive
+    timestamps are taken to be UTC already, as they are read back from
+    the database
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    start = timestamp.replace(minute=0, second=0, microsecond=0)
+    if period == Period.DAY:
+        start = start.replace(hour=0)
+    return start
+
+
+def _either(
+    pick: Callable[[float, float], float], a: Optional[float], b: Optional[float]
+) -> Optional[float]:
+    if a is None or b is None:
+        return a if b is None else b
+    return pick(a, b)
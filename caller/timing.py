@@ -0,0 +1,80 @@
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any, Optional
+
+
+@dataclass
+class Timings:
+    """
+    Phases of a single send in milliseconds. `connect_ms` includes name
+    resolution, httpcore does not report it separately. Connect and TLS
+    are None when a pooled connection was reused
+    """
+
+    connect_ms: Optional[float] = None
+    tls_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    download_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    request_bytes: Optional[int] = None
+    response_bytes: Optional[int] = None
+
+    def dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    def __str__(self) -> str:
+        if self.total_ms is None:
+            return "no timings"
+
+        phases = [
+            f"{name}={value:.1f}ms"
+            for name, value in (
+                ("connect", self.connect_ms),
+                ("tls", self.tls_ms),
+                ("ttfb", self.ttfb_ms),
+                ("download", self.download_ms),
+            )
+            if value is not None
+        ]
+        return (
+            f"total={self.total_ms:.1f}ms ({' '.join(phases)}), "
+            f"sent={self.request_bytes}B received={self.response_bytes}B"
+        )
+
+
+class RequestTimer:
+    """
+    httpcore trace extension recording when each phase of a send
+    started and completed
+    """
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.marks: dict[str, float] = {}
+
+    def __call__(self, name: str, info: dict[str, Any]) -> None:
+        # names look like "connection.connect_tcp.started"
+        self.marks[name.split(".", 1)[-1]] = perf_counter()
+
+    async def atrace(self, name: str, info: dict[str, Any]) -> None:
+        self(name, info)
+
+    def _between(self, start: str, end: str) -> Optional[float]:
+        if start not in self.marks or end not in self.marks:
+            return None
+        return (self.marks[end] - self.marks[start]) * 1000
+
+    def finish(self, request_bytes: int, response_bytes: int) -> Timings:
+        end = perf_counter()
+        headers_at = self.marks.get("receive_response_headers.complete")
+        return Timings(
+            connect_ms=self._between("connect_tcp.started", "connect_tcp.complete"),
+            tls_ms=self._between("start_tls.started", "start_tls.complete"),
+            ttfb_ms=self._between(
+                "send_request_headers.started", "receive_response_headers.complete"
+            ),
+            download_ms=(end - headers_at) * 1000 if headers_at is not None else None,
+            total_ms=(end - self.start) * 1000,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+        )
@@ -0,0 +1,256 @@
+import base64
+import json
+from collections import Counter
+from typing import Any, Iterable, Optional, TextIO
+
+from pydantic import ValidationError
+from pydantic.json import pydantic_encoder
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from caller.blobs import BodyCapture, Buffer
+from caller.crud import (
+    api_call_crud,
+    header_crud,
+    parameter_crud,
+    response_crud,
+    unit_of_work,
+)
+from caller.db import APICall, Body, Response
+from caller.schemas.api_calls import APICallCreate, APICallGet, APICallImport
+from caller.schemas.headers import HeaderCreate
+from caller.schemas.parameters import ParameterCreate
+from caller.schemas.responses import ResponseCreate, ResponseGet, ResponseImport
+
+FORMAT = "caller-export"
+VERSION = 1
+
+# bodies are written as `body` instead of the columns they are stored in
+_BODY_COLUMNS = {"content", "content_codec", "blob_key", "body_hash"}
+
+
+def export_jsonl(
+    session: Session, out: TextIO, *, responses: bool = False, batch_size: int = 500
+) -> Counter[str]:
+    """
+    Write global headers, api calls with their headers and parameters and
+    optionally every stored response to `out`, one JSON object per line.
+    Rows are streamed `batch_size` at a time so memory use does not grow
+    with the history. Returns how many records of each type were written
+    """
+    counts: Counter[str] = Counter()
+
+    def write(record: dict[str, Any]) -> None:
+        out.write(json.dumps(record, default=pydantic_encoder) + "\n")
+        counts[record["type"]] += 1
+
+    out.write(json.dumps({"type": FORMAT, "version": VERSION}) + "\n")
+
+    for header in header_crud.get_globals(session):
+        write({"type": "header", "key": header.key, "value": header.value})
+
+    api_calls = (
+        select(APICall)
+        .order_by(APICall.id)
+        .options(*api_call_crud.load_options)
+        .execution_options(yield_per=batch_size)
+    )
+    for api_call in session.scalars(api_calls):
+        write(
+            {
+                "type": "api_call",
+                **APICallGet.from_orm(api_call).dict(),
+                "headers": [
+                    {"key": header.key, "value": header.value}
+                    for header in api_call.headers
+                ],
+                "parameters": [
+                    {"key": parameter.key, "value": parameter.value}
+                    for parameter in api_call.parameters
+                ],
+            }
+        )
+    if not responses:
+        return counts
+
+    stored_responses = (
+        select(Response)
+        .order_by(Response.id)
+        .options(
+            undefer(Response.content),
+            selectinload(Response.stored_body).undefer(Body.content),
+        )
+        .execution_options(yield_per=batch_size)
+    )
+    for response in session.scalars(stored_responses):
+        write(
+            {
+                "type": "response",
+                **ResponseGet.from_orm(response).dict(exclude=_BODY_COLUMNS),
+                **_encode_body(response.body),
+            }
+        )
+    return counts
+
+
+def import_jsonl(
+    session: Session,
+    lines: Iterable[str],
+    *,
+    keep_ids: bool = False,
+    batch_size: int = 500,
+) -> Counter[str]:
+    """
+    Read an export written by `export_jsonl`. Records are inserted with
+    `create_many`, `batch_size` at a time, in a single transaction so a
+    broken file imports nothing. New ids are assigned unless `keep_ids`
+    is set, in which case importing over existing rows fails. Global
+    headers that already exist are skipped. Returns how many records of
+    each type were imported
+    """
+    importer = _Importer(session, keep_ids=keep_ids, batch_size=batch_size)
+    with unit_of_work(session):
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if number == 1:
+                    _check_format(record)
+                else:
+                    importer.add(record)
+            except (ValueError, ValidationError, KeyError) as e:
+                raise ValueError(f"line {number}: {e}") from e
+        importer.flush()
+    return importer.counts
+
+
+class _Importer:
+    def __init__(self, session: Session, *, keep_ids: bool, batch_size: int) -> None:
+        self.session = session
+        self.keep_ids = keep_ids
+        self.batch_size = batch_size
+        self.counts: Counter[str] = Counter()
+        # exported id -> id in this database
+        self.api_call_ids: dict[int, int] = {}
+        self.global_headers = {
+            (header.key, header.value) for header in header_crud.get_globals(session)
+        }
+        self.api_calls: list[tuple[int, dict[str, Any]]] = []
+        self.responses: list[ResponseCreate] = []
+
+    def add(self, record: dict[str, Any]) -> None:
+        record_type = record.pop("type")
+        if record_type == "header":
+            self._add_header(HeaderCreate.parse_obj(record))
+        elif record_type == "api_call":
+            self.api_calls.append((record["id"], record))
+            if len(self.api_calls) >= self.batch_size:
+                self._flush_api_calls()
+        elif record_type == "response":
+            # the api calls responses refer to are always exported first
+            self._flush_api_calls()
+            self.responses.append(self._response(record))
+            if len(self.responses) >= self.batch_size:
+                self._flush_responses()
+        else:
+            raise ValueError(f"unknown record type {record_type!r}")
+
+    def flush(self) -> None:
+        self._flush_api_calls()
+        self._flush_responses()
+
+    def _add_header(self, header: HeaderCreate) -> None:
+        if (header.key, header.value) in self.global_headers:
+            return
+        header_crud.create(self.session, obj_in=header)
+        self.global_headers.add((header.key, header.value))
+        self.counts["header"] += 1
+
+    def _flush_api_calls(self) -> None:
+        if not self.api_calls:
+            return
+
+        schema: type[APICallCreate] = APICallCreate
+        if self.keep_ids:
+            schema = APICallImport
+        db_objs = api_call_crud.create_many(
+            self.session,
+            objs_in=[schema.parse_obj(record) for _, record in self.api_calls],
+        )
+        headers = []
+        parameters = []
+        for (old_id, record), db_obj in zip(self.api_calls, db_objs):
+            self.api_call_ids[old_id] = db_obj.id
+            headers += [
+                HeaderCreate(**header, api_call_id=db_obj.id)
+                for header in record.get("headers", [])
+            ]
+            parameters += [
+                ParameterCreate(**parameter, api_call_id=db_obj.id)
+                for parameter in record.get("parameters", [])
+            ]
+        header_crud.create_many(self.session, objs_in=headers)
+        parameter_crud.create_many(self.session, objs_in=parameters)
+
+        self.counts["api_call"] += len(self.api_calls)
+        self.api_calls = []
+        self.session.expunge_all()
+
+    def _response(self, record: dict[str, Any]) -> ResponseCreate:
+        if self.keep_ids:
+            api_call_id = record["api_call_id"]
+        elif (api_call_id := self.api_call_ids.get(record["api_call_id"])) is None:
+            raise ValueError(f"response for unknown api call {record['api_call_id']}")
+
+        body = _decode_body(record.pop("body"), record.pop("body_encoding"))
+        record["api_call_id"] = api_call_id
+        if body is not None:
+            # large bodies go to the blob store, same as when they are sent
+            capture = BodyCapture()
+            capture.write(body)
+            captured = capture.finish()
+            record.update(
+                content=captured.content,
+                blob_key=captured.blob_key,
+                body_hash=captured.hash,
+            )
+
+        schema: type[ResponseCreate] = ResponseCreate
+        if self.keep_ids:
+            schema = ResponseImport
+        return schema.parse_obj(record)
+
+    def _flush_responses(self) -> None:
+        if not self.responses:
+            return
+
+        response_crud.create_many(self.session, objs_in=self.responses)
+        self.counts["response"] += len(self.responses)
+        self.responses = []
+        self.session.expunge_all()
+
+
+def _check_format(record: dict[str, Any]) -> None:
+    if record.get("type") != FORMAT:
+        raise ValueError("not a caller export")
+    if record.get("version") != VERSION:
+        raise ValueError(f"unsupported export version {record.get('version')}")
+
+
+def _encode_body(body: Optional[Buffer]) -> dict[str, Optional[str]]:
+    if body is None:
+        return {"body": None, "body_encoding": None}
+    raw = bytes(body)
+    try:
+        return {"body": raw.decode(), "body_encoding": "utf-8"}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(raw).decode(), "body_encoding": "base64"}
+
+
+def _decode_body(body: Optional[str], encoding: Optional[str]) -> Optional[bytes]:
+    if body is None:
+        return None
+    if encoding == "base64":
+        return base64.b64decode(body)
+    return body.encode()
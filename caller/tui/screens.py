@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import json
+
+from pydantic import ValidationError
 from textual import on
 from textual.app import ComposeResult
 from textual.binding import Binding
@@ -7,8 +10,11 @@ from textual.message import Message
 from textual.screen import Screen
 from textual.widgets import Footer, Header, Input, Label
 
+from caller.config import settings
 from caller.db import APICall
 from caller.schemas.api_calls import APICallCreate, APICallUpdate
+from caller.schemas.retention import RetentionPolicy
+from caller.schemas.retry import RetryPolicy
 from caller.tui.widgets import (
     APICallsMainContainer,
     APICallView,
@@ -25,13 +31,28 @@ class APICallListScreen(Screen):
         Binding("s", "set_url", "Set url"),
         Binding("u", "set_method", "Set method"),
         Binding("t", "set_content", "Set content"),
+        Binding("o", "set_timeout", "Set timeout"),
+        Binding("a", "set_tags", "Set tags"),
+        Binding("h", "toggle_cache", "Toggle cache"),
+        Binding("y", "set_retry_policy", "Set retry policy"),
+        Binding("p", "set_retention_policy", "Set retention policy"),
         Binding("r", "rename", "Rename"),
         Binding("d", "delete_api_call", "Delete"),
+        Binding("x", "cancel_call", "Cancel request"),
+        Binding("slash", "search", "Search"),
     ]
 
     def __init__(self, api_calls: list[APICall]) -> None:
         super().__init__()
         self.api_calls = api_calls
+        self.cursor: int | None = None
+        self.has_more = False
+        self.page_loaded(api_calls)
+
+    def page_loaded(self, api_calls: list[APICall]) -> None:
+        self.has_more = len(api_calls) >= settings.page_size
+        if api_calls:
+            self.cursor = api_calls[-1].id
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -62,11 +83,37 @@ class APICallListScreen(Screen):
             super().__init__()
             self.api_call = api_call
 
+    class CancelCall(Message):
+        def __init__(self, api_call: APICall) -> None:
+            super().__init__()
+            self.api_call = api_call
+
+    class ShowResponse(Message):
+        def __init__(self, api_call: APICall) -> None:
+            super().__init__()
+            self.api_call = api_call
+
+    class Search(Message):
+        def __init__(self, query: str) -> None:
+            super().__init__()
+            self.query = query
+
+    class LoadMore(Message):
+        def __init__(self, screen: APICallListScreen, after: int | None) -> None:
+            super().__init__()
+            self.screen = screen
+            self.after = after
+
     def action_create_api_call(self) -> None:
         input_widget = Input(id="api-call-name", placeholder="Name")
         self.query_one("#api-call-details-side").mount(input_widget)
         input_widget.focus()
 
+    def action_search(self) -> None:
+        input_widget = Input(id="search", placeholder="search")
+        self.query_one("#api-call-details-side").mount(input_widget)
+        input_widget.focus()
+
     def action_delete_api_call(self) -> None:
         api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
         if api_call_list_item is None:
@@ -81,7 +128,8 @@ class APICallListScreen(Screen):
         api_call_list.index -= 1
 
     def action_go_bottom(self) -> None:
-        self.query_one("#api-calls", ListViewVim).index = len(self.api_calls) - 1
+        api_call_list = self.query_one("#api-calls", ListViewVim)
+        api_call_list.index = len(api_call_list._nodes) - 1
 
     def action_go_top(self) -> None:
         self.query_one("#api-calls", ListViewVim).index = 0
@@ -126,6 +174,83 @@ class APICallListScreen(Screen):
         self.query_one("#api-call-details-side").mount(input_widget)
         input_widget.focus()
 
+    def action_set_timeout(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        input_widget = ModifyAPICallInput(
+            id="api-call-update",
+            attribute="timeout",
+            placeholder="timeout (seconds)",
+        )
+        self.query_one("#api-call-details-side").mount(input_widget)
+        input_widget.focus()
+
+    def action_set_tags(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        input_widget = ModifyAPICallInput(
+            id="api-call-update",
+            value=",".join(api_call_list_item.api_call.tags or []),
+            attribute="tags",
+            placeholder="tags (comma separated)",
+        )
+        self.query_one("#api-call-details-side").mount(input_widget)
+        input_widget.focus()
+
+    def action_toggle_cache(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        api_call = api_call_list_item.api_call
+        api_call_view = self.query_one("#api-call-details-side", APICallView)
+        self.post_message(
+            self.Update(
+                api_call_view, api_call, APICallUpdate(use_cache=not api_call.use_cache)
+            )
+        )
+
+    def action_set_retry_policy(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        retry_policy = api_call_list_item.api_call.retry_policy
+        input_widget = ModifyAPICallInput(
+            id="api-call-update",
+            value=json.dumps(retry_policy or RetryPolicy().dict()),
+            attribute="retry_policy",
+            placeholder="retry policy (json)",
+        )
+        self.query_one("#api-call-details-side").mount(input_widget)
+        input_widget.focus()
+
+    def action_set_retention_policy(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        retention_policy = api_call_list_item.api_call.retention_policy
+        input_widget = ModifyAPICallInput(
+            id="api-call-update",
+            value=json.dumps(retention_policy or RetentionPolicy().dict()),
+            attribute="retention_policy",
+            placeholder="retention policy (json)",
+        )
+        self.query_one("#api-call-details-side").mount(input_widget)
+        input_widget.focus()
+
+    def action_cancel_call(self) -> None:
+        api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
+        if api_call_list_item is None:
+            return None
+
+        self.post_message(self.CancelCall(api_call_list_item.api_call))
+
     def action_rename(self) -> None:
         api_call_list_item = self.query_one("#api-calls", ListViewVim).highlighted_child
         if api_call_list_item is None:
@@ -147,8 +272,13 @@ class APICallListScreen(Screen):
         if api_call_list_item is None:
             return None
 
-        api_call_update = APICallUpdate()
-        setattr(api_call_update, event.input.attribute, event.value)
+        try:
+            api_call_update = APICallUpdate.parse_obj(
+                {event.input.attribute: event.value}
+            )
+        except ValidationError as e:
+            self.query_one("#response-content", Label).update(str(e))
+            return None
 
         api_call_view = self.query_one("#api-call-details-side", APICallView)
         self.post_message(
@@ -165,10 +295,12 @@ class APICallListScreen(Screen):
         api_call_view.api_call = event.item.api_call
         api_call_view.update_values()
 
-        if len(event.item.api_call.responses) > 0:
-            self.query_one("#response-content", Label).update(
-                str(event.item.api_call.responses[0].content)
-            )
+        if self.has_more and event.list_view.index == len(event.list_view._nodes) - 1:
+            # only one page in flight at a time
+            self.has_more = False
+            self.post_message(self.LoadMore(self, self.cursor))
+
+        self.post_message(self.ShowResponse(event.item.api_call))
 
     @on(ListViewVim.Selected, "#api-calls")
     def call_api(self) -> None:
@@ -185,3 +317,10 @@ class APICallListScreen(Screen):
         event.stop()
         self.post_message(self.Create(APICallCreate(name=event.value)))
         event.input.remove()
+
+    @on(Input.Submitted, "#search")
+    def search(self, event: Input.Submitted) -> None:
+        event.stop()
+        if event.value.strip():
+            self.post_message(self.Search(event.value))
+        event.input.remove()
@@ -28,7 +28,9 @@ class APICallsMainContainer(Container):
         )
         yield APICallView(self.api_calls[0], id="api-call-details-side")
         yield Container(
-            Label("asd", id="response-content"), id="api-response-container"
+            Label("", id="in-flight"),
+            Label("asd", id="response-content"),
+            id="api-response-container",
         )
 
 
@@ -96,6 +98,13 @@ class APICallView(Container):
                 f"method: {self.api_call.method.value}", id="selected-api-call-method"
             ),
             Label(f"content: {self.api_call.content}", id="selected-api-call-content"),
+            Label(f"timeout: {self.api_call.timeout}", id="selected-api-call-timeout"),
+            Label(
+                f"tags: {','.join(self.api_call.tags or [])}",
+                id="selected-api-call-tags",
+            ),
+            Label(f"cache: {self.api_call.use_cache}", id="selected-api-call-cache"),
+            Label("", id="api-call-stats"),
             Label("", id="api-call-response"),
             id="api-call-side-container",
         )
@@ -114,6 +123,15 @@ class APICallView(Container):
         self.query_one("#selected-api-call-content", Label).update(
             f"content: {self.api_call.content}"
         )
+        self.query_one("#selected-api-call-timeout", Label).update(
+            f"timeout: {self.api_call.timeout}"
+        )
+        self.query_one("#selected-api-call-tags", Label).update(
+            f"tags: {','.join(self.api_call.tags or [])}"
+        )
+        self.query_one("#selected-api-call-cache", Label).update(
+            f"cache: {self.api_call.use_cache}"
+        )
 
 
 class ModifyAPICallInput(Input):
@@ -0,0 +1,139 @@
+import asyncio
+import queue
+import threading
+from time import monotonic
+from types import TracebackType
+from typing import Optional, Union
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from caller.cache import CacheStatus
+from caller.config import settings
+from caller.crud import response_crud, unit_of_work
+from caller.schemas.responses import ResponseCreate
+from caller.sender import PreparedCall, SentResponse, response_create
+
+
+class _Stop:
+    pass
+
+
+_STOP = _Stop()
+
+
+class ResponseWriter:
+    """
+    Write-behind persistence for responses. Submitted responses go into a
+    bounded queue that a background thread with its own session drains,
+    one transaction per batch. Submitting blocks while the queue is full
+    and closing (or leaving the `with` block) waits until everything
+    submitted has been written
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ) -> None:
+        self.engine = engine
+        self.batch_size = batch_size or settings.write_batch_size
+        self.flush_interval = (
+            settings.write_flush_interval if flush_interval is None else flush_interval
+        )
+        self.written = 0
+        self.error: Optional[BaseException] = None
+        self._queue: queue.Queue[Union[ResponseCreate, _Stop]] = queue.Queue(
+            max_queue or settings.write_queue_size
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="response-writer", daemon=True
+        )
+
+    def __enter__(self) -> "ResponseWriter":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Flush everything submitted so far and stop the writer thread.
+        Re-raises the first error the writer ran into
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, prepared: PreparedCall, sent: SentResponse) -> None:
+        if (obj_in := self._response_create(prepared, sent)) is not None:
+            self._queue.put(obj_in)
+
+    async def submit_async(self, prepared: PreparedCall, sent: SentResponse) -> None:
+        """
+        Like `submit` but waits for room in the queue without blocking
+        the event loop
+        """
+        if (obj_in := self._response_create(prepared, sent)) is None:
+            return
+        try:
+            self._queue.put_nowait(obj_in)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._queue.put, obj_in)
+
+    def _response_create(
+        self, prepared: PreparedCall, sent: SentResponse
+    ) -> Optional[ResponseCreate]:
+        if self.error is not None:
+            raise self.error
+        # fresh cache hits never reached the network, same as save_response
+        if sent.cache_status == CacheStatus.FRESH:
+            return None
+        return response_create(prepared, sent)
+
+    def _run(self) -> None:
+        with Session(self.engine) as session:
+            stopping = False
+            while not stopping:
+                batch: list[ResponseCreate] = []
+                item = self._queue.get()
+                # linger a little so a trickle of responses still gets batched
+                deadline = monotonic() + self.flush_interval
+                while True:
+                    if isinstance(item, _Stop):
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(deadline - monotonic(), 0))
+                    except queue.Empty:
+                        break
+
+                if not batch or self.error is not None:
+                    continue
+                try:
+                    with unit_of_work(session):
+                        response_crud.create_many(session, objs_in=batch)
+                except Exception as e:
+                    # keep draining so producers never block on a dead writer
+                    self.error = e
+                else:
+                    self.written += len(batch)
+                session.expunge_all()